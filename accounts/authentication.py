@@ -0,0 +1,59 @@
+from rest_framework import exceptions, status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from companies.models import User
+from roles.utils import get_permission_versions
+from .revocation import get_token_state
+from .tokens import CATALOG_VERSION_CLAIM, PERMISSION_MASK_CLAIM, PERMISSION_VERSION_CLAIM, USER_CLAIMS
+
+class AccountLocked(exceptions.APIException):
+    status_code = status.HTTP_423_LOCKED
+    default_detail = 'Account is locked due to failed login attempts'
+    default_code = 'account_locked'
+
+    def __init__(self, wait=None):
+        super().__init__()
+        self.wait = wait
+
+class PermissionClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the identity and permission claims embedded
+    by PermissionRefreshToken while the user's permission version is unchanged.
+    A version bump (role assigned/removed, role permissions edited, user
+    updated) makes the token fall back to the regular database lookup.
+    Tokens revoked by logout, and users locked out by failed logins, are
+    rejected without a database query.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        revoked, locked_for = get_token_state(validated_token)
+        if revoked:
+            raise InvalidToken({'detail': 'Token has been revoked', 'code': 'token_revoked'})
+        if locked_for:
+            raise AccountLocked(wait=locked_for)
+        return validated_token
+
+    def get_user(self, validated_token):
+        if PERMISSION_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        catalog_version, version = get_permission_versions(user_id)
+        if (validated_token[CATALOG_VERSION_CLAIM] != catalog_version or
+                validated_token[PERMISSION_VERSION_CLAIM] != version):
+            return super().get_user(validated_token)
+
+        return self.user_from_claims(validated_token)
+
+    def user_from_claims(self, validated_token):
+        claims = {field: validated_token[field] for field in USER_CLAIMS}
+        claims['id'] = validated_token[api_settings.USER_ID_CLAIM]
+        # Fields not carried by the token (password, lockout state, ...) stay
+        # deferred and are loaded from the database only if accessed
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in claims]
+        user = User.from_db('default', field_names, [claims[name] for name in field_names])
+        user.token_permission_mask = validated_token[PERMISSION_MASK_CLAIM]
+        user.token_catalog_version = validated_token[CATALOG_VERSION_CLAIM]
+        return user
@@ -0,0 +1,14 @@
+from django.contrib.auth.backends import ModelBackend
+
+class PreloadedUserBackend(ModelBackend):
+    """
+    Authenticates a user instance the caller has already loaded, e.g. by the
+    login email, instead of fetching it again by username.
+    """
+
+    def authenticate(self, request, user=None, password=None, **kwargs):
+        if user is None or password is None:
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
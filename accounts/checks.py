@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Token revocation, account lockout and login rate limits live in the
+    default cache. With a per-process cache each worker keeps its own copy,
+    so a logout or lockout only applies in the worker that handled it.
+    """
+    if settings.DEBUG or settings.TESTING:
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'The default cache ({backend}) is not shared between worker processes.',
+        hint='Set REDIS_URL. If a single process serves every request, silence accounts.E001.',
+        id='accounts.E001',
+    )]
@@ -3,37 +3,133 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from companies.models import User
 from roles.models import UserRole
+from roles.utils import get_effective_permissions, get_permission_catalog, get_permission_version
+from .notifications import role_group, user_group
+from .presence import connection_closed, connection_opened
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes permission changes to the client as deltas:
+
+        {"type": "permissionUpdate", "userId": 1, "version": 7, "baseVersion": 5,
+         "added": ["CREATE_USER"], "removed": []}
+
+    ``version`` is the user's permission version and only ever increases.
+    A client whose last known version is not ``baseVersion`` (it missed
+    messages, or just connected) sends ``{"type": "resync"}`` and gets the
+    full set back as ``permissionSync``.
+    """
+
     async def connect(self):
         self.user = self.scope["user"]
         if self.user.is_anonymous:
             await self.close()
         else:
-            self.group_name = f"user_{self.user.id}"
+            self.group_name = user_group(self.user.id)
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            # Role masks of the user's roles (role broadcasts update them) and
+            # the permissions and version deltas are computed against
+            self.role_masks = {}
+            roles, self.version, self.permissions = await self.load_state()
+            await self.follow_roles(roles)
             await self.accept()
 
     async def disconnect(self, close_code):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            for role_id in self.role_masks:
+                await self.channel_layer.group_discard(role_group(role_id), self.channel_name)
+            if hasattr(self, 'permissions'):
+                await database_sync_to_async(connection_closed)(self.user.id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get('type') == 'resync':
+            await self.resync()
+
+    async def resync(self):
+        version = await self.get_version()
+        self.permissions = frozenset(await self.get_user_permissions(self.user.id))
+        self.version = version
+        await self.send(text_data=json.dumps({
+            'type': 'permissionSync',
+            'userId': self.user.id,
+            'version': version,
+            'permissions': sorted(self.permissions),
+        }))
+
+    async def follow_roles(self, roles):
+        """Join the groups of the user's current roles and leave the rest"""
+        roles = {} if self.user.is_superuser else dict(roles)
+        for role_id in roles.keys() - self.role_masks.keys():
+            await self.channel_layer.group_add(role_group(role_id), self.channel_name)
+        for role_id in self.role_masks.keys() - roles.keys():
+            await self.channel_layer.group_discard(role_group(role_id), self.channel_name)
+        self.role_masks = roles
 
     async def permission_update(self, event):
+        await self.follow_roles(event.get('roles', []))
+        await self.send_delta(frozenset(event['permissions']), await self.get_version())
+
+    async def role_permissions_update(self, event):
+        role_id = event['role_id']
+        if role_id not in self.role_masks or self.role_masks[role_id] == event['permission_mask']:
+            return
+        self.role_masks[role_id] = event['permission_mask']
+        await self.send_delta(*await self.get_role_state())
+
+    async def send_delta(self, permissions, version):
+        added = sorted(permissions - self.permissions)
+        removed = sorted(self.permissions - permissions)
+        if not added and not removed:
+            return
+        base_version, self.version, self.permissions = self.version, max(version, self.version), permissions
         await self.send(text_data=json.dumps({
             'type': 'permissionUpdate',
-            'userId': event['user_id'],
-            'permissions': event['permissions']
+            'userId': self.user.id,
+            'version': self.version,
+            'baseVersion': base_version,
+            'added': added,
+            'removed': removed,
         }))
 
+    def permission_names(self, mask):
+        catalog = get_permission_catalog()
+        if self.user.is_superuser:
+            mask = catalog.all_mask
+        return frozenset(name for bit, name in catalog.names.items() if mask >> bit & 1)
+
+    def effective_mask(self):
+        mask = 0
+        for role_mask in self.role_masks.values():
+            mask |= role_mask
+        return mask
+
+    @database_sync_to_async
+    def load_state(self):
+        # Counted as online before reading state, so no change can slip between
+        connection_opened(self.user.id)
+        roles = list(UserRole.objects.filter(user_id=self.user.id).values_list('role_id', 'role__permission_mask'))
+        mask = 0
+        for _, role_mask in roles:
+            mask |= role_mask
+        return roles, get_permission_version(self.user.id), self.permission_names(mask)
+
+    @database_sync_to_async
+    def get_role_state(self):
+        return self.permission_names(self.effective_mask()), get_permission_version(self.user.id)
+
+    @database_sync_to_async
+    def get_version(self):
+        return get_permission_version(self.user.id)
+
     @database_sync_to_async
     def get_user_permissions(self, user_id):
         try:
-            user = User.objects.get(id=user_id)
-            user_roles = UserRole.objects.filter(user=user)
-            permissions = set()
-            for user_role in user_roles:
-                role_permissions = user_role.role.permissions.all()
-                permissions.update([perm.name for perm in role_permissions])
-            return list(permissions)
+            user = self.user if self.user.id == user_id else User.objects.get(id=user_id)
+            return sorted(get_effective_permissions(user))
         except User.DoesNotExist:
-            return []
\ No newline at end of file
+            return []
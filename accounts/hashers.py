@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2-SHA256 hasher with the iteration budget taken from
+    PASSWORD_HASH_ITERATIONS. Hashes made with a different count are
+    upgraded (or downgraded) on the user's next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+def hash_passwords(passwords):
+    """
+    Hash a batch of passwords with the preferred hasher. Used as a process
+    pool task, so this module must stay importable without the app registry.
+    """
+    return [make_password(password) for password in passwords]
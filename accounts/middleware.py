@@ -1,15 +1,55 @@
 from urllib.parse import parse_qs
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from channels.db import database_sync_to_async
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import AccessToken
 from companies.models import User
+from roles.utils import get_permission_versions
+from .revocation import get_token_state
+from .tokens import CATALOG_VERSION_CLAIM, PERMISSION_VERSION_CLAIM, USER_CLAIMS
+
+# Identity fields of a user, keyed by their permission version so any change
+# to the user row (which bumps it) retires the snapshot
+USER_SNAPSHOT_KEY = 'ws_user:{user_id}:{version}'
+
+def user_from_snapshot(snapshot):
+    # Fields outside the snapshot stay deferred, as for token-claim users
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in snapshot]
+    return User.from_db('default', field_names, [snapshot[name] for name in field_names])
 
 @database_sync_to_async
 def get_user_from_token(token):
+    """
+    Resolve the socket's user without touching the database when possible:
+    from the token's own claims while they are current, else from a cached
+    snapshot of the user row.
+    """
     try:
         access_token = AccessToken(token)
-        user_id = access_token['user_id']
-        return User.objects.get(id=user_id)
+        revoked, locked_for = get_token_state(access_token)
+        if revoked or locked_for:
+            return AnonymousUser()
+        user_id = access_token[api_settings.USER_ID_CLAIM]
+        catalog_version, version = get_permission_versions(user_id)
+
+        if (access_token.get(CATALOG_VERSION_CLAIM) == catalog_version and
+                access_token.get(PERMISSION_VERSION_CLAIM) == version):
+            # Identity only: the socket outlives the permission claims, so
+            # permissions are always looked up live
+            return user_from_snapshot(dict({field: access_token[field] for field in USER_CLAIMS}, id=user_id))
+
+        key = USER_SNAPSHOT_KEY.format(user_id=user_id, version=version)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = User.objects.filter(pk=user_id).values('id', *USER_CLAIMS).first()
+            if snapshot is None:
+                return AnonymousUser()
+            cache.set(key, snapshot, settings.PERMISSION_CACHE_TIMEOUT)
+        if not snapshot['is_active']:
+            return AnonymousUser()
+        return user_from_snapshot(snapshot)
     except Exception:
         return AnonymousUser()
 
@@ -27,4 +67,4 @@ class JWTAuthMiddleware:
         else:
             scope['user'] = AnonymousUser()
         
-        return await self.inner(scope, receive, send)
\ No newline at end of file
+        return await self.inner(scope, receive, send)
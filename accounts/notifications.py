@@ -0,0 +1,172 @@
+"""
+Real-time permission notifications.
+
+Permission changes are collected while a transaction is open and sent once
+it commits: any number of changes to the same user coalesce into a single
+permission_update message. A change to a role's permissions is one
+broadcast to the ``role_<id>`` group that every connected holder of the role
+joins, instead of a lookup and a message per holder. With Redis, messages
+are handed to a background sender, so the request that made the change never
+waits on the channel layer. Without Redis the in-memory layer is only usable
+from the server's own event loop, so they are delivered inline in the request.
+"""
+import atexit
+import functools
+import logging
+import queue
+import threading
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .presence import online_users
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+def role_group(role_id):
+    return f'role_{role_id}'
+
+def notify_permissions_changed(user_ids):
+    """Queue a permission_update for each user, sent after the current transaction commits"""
+    _collect(user_ids=user_ids)
+
+def notify_roles_changed(role_ids):
+    """Queue one broadcast per role to every connected holder of it"""
+    _collect(role_ids=role_ids)
+
+def _collect(user_ids=(), role_ids=()):
+    # One flush per transaction. If the transaction that scheduled it rolled
+    # back, its callback was discarded: start over so the ids it collected
+    # are dropped along with it.
+    connection = transaction.get_connection()
+    callback = getattr(_local, 'callback', None)
+    scheduled = (
+        callback is not None and connection.in_atomic_block
+        and any(func is callback for _, func, _ in connection.run_on_commit)
+    )
+    if not scheduled:
+        _local.users, _local.roles = set(), set()
+        _local.callback = callback = functools.partial(_flush)
+    _local.users.update(user_ids)
+    _local.roles.update(role_ids)
+    if not scheduled:
+        transaction.on_commit(callback)
+
+def _flush():
+    users, roles = _local.users, _local.roles
+    _local.users, _local.roles, _local.callback = set(), set(), None
+    if users or roles:
+        notification_sender.send((sorted(users), sorted(roles)))
+
+def build_messages(user_ids, role_ids):
+    """
+    [(group, message)] for a batch. Users get their permissions and role
+    masks (so their sockets can follow role groups); roles get their current
+    mask, which each socket diffs against what its user had.
+    """
+    from companies.models import User
+    from roles.models import Role, UserRole
+    from roles.utils import get_permission_catalog
+
+    messages = []
+    # Nothing to build for users without an open socket
+    user_ids = online_users(user_ids)
+    if user_ids:
+        catalog = get_permission_catalog()
+        memberships = {}
+        for user_id, role_id, mask in UserRole.objects.filter(user_id__in=user_ids).values_list(
+                'user_id', 'role_id', 'role__permission_mask'):
+            memberships.setdefault(user_id, []).append([role_id, mask])
+        for user_id, is_superuser in User.objects.filter(pk__in=user_ids).values_list('pk', 'is_superuser'):
+            roles = memberships.get(user_id, [])
+            mask = catalog.all_mask
+            if not is_superuser:
+                mask = 0
+                for _, role_mask in roles:
+                    mask |= role_mask
+            messages.append((user_group(user_id), {
+                'type': 'permission_update',
+                'user_id': user_id,
+                'permissions': sorted(name for bit, name in catalog.names.items() if mask >> bit & 1),
+                # Pairs rather than a dict: msgpack (channels-redis) only allows string keys
+                'roles': roles,
+            }))
+    for role_id, mask in Role.objects.filter(pk__in=role_ids).values_list('pk', 'permission_mask'):
+        messages.append((role_group(role_id), {
+            'type': 'role_permissions_update',
+            'role_id': role_id,
+            'permission_mask': mask,
+        }))
+    return messages
+
+def send_messages(messages):
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        for group, message in messages:
+            await channel_layer.group_send(group, message)
+
+    async_to_sync(send_all)()
+
+class NotificationSender:
+    """
+    Background thread that builds and sends notification batches. In 'sync'
+    mode (tests, or no Redis) batches are sent inline instead.
+    """
+
+    def __init__(self, max_queue=1000):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def send(self, batch):
+        if settings.NOTIFICATION_MODE == 'sync':
+            self._deliver(batch)
+            return
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            # Clients resync on reconnect; never block the request on this
+            logger.warning('Notification queue full, dropping batch: %r', batch)
+
+    def flush(self):
+        """Deliver everything queued so far (used at shutdown)"""
+        while True:
+            try:
+                batch = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._deliver(batch)
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='notification-sender', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            close_old_connections()
+            self._deliver(batch)
+            close_old_connections()
+
+    def _deliver(self, batch):
+        user_ids, role_ids = batch
+        try:
+            send_messages(build_messages(user_ids, role_ids))
+        except Exception:
+            logger.exception('Failed to send permission updates to %d users and %d roles', len(user_ids), len(role_ids))
+
+notification_sender = NotificationSender()
+atexit.register(notification_sender.flush)
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+class PoolSaturated(Exception):
+    pass
+
+class BoundedPool:
+    """
+    Thread pool for CPU-heavy auth work (password hashing) that refuses new
+    work instead of queueing it without limit. At most `workers` tasks run at
+    once and `queue_size` more may wait; submit() raises PoolSaturated beyond
+    that so callers can shed load with a 429.
+
+    Threads are enough because the hashlib PBKDF2/scrypt implementations
+    release the GIL while hashing.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            return self._get_executor().submit(self._run, func, *args)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='auth-pool')
+            return self.executor
+
+    def _run(self, func, *args):
+        # Worker threads live outside the request cycle, so manage their
+        # database connections the way request_started/finished would
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+            self.slots.release()
+
+login_pool = BoundedPool(settings.LOGIN_POOL_WORKERS, settings.LOGIN_POOL_QUEUE)
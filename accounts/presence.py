@@ -0,0 +1,35 @@
+"""
+Presence registry: how many WebSocket connections each user has open.
+
+Counts live in the shared cache next to the channel layer, so any worker
+can tell whether a notification has anyone to reach before doing the work
+to build it. Counts are never expired (a long-lived socket must not go
+"offline"); a worker that dies without disconnecting leaves a user counted
+as online, which only costs the work we would have done anyway.
+"""
+from django.core.cache import cache
+
+PRESENCE_KEY = 'ws_presence:{user_id}'
+
+def connection_opened(user_id):
+    key = PRESENCE_KEY.format(user_id=user_id)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, None)
+
+def connection_closed(user_id):
+    key = PRESENCE_KEY.format(user_id=user_id)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+def online_users(user_ids):
+    """The subset of user_ids with at least one open connection (one cache call)"""
+    keys = {PRESENCE_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+    counts = cache.get_many(keys)
+    return [keys[key] for key, count in counts.items() if count > 0]
@@ -0,0 +1,97 @@
+"""
+Cache-backed sliding-window limits for login attempts.
+
+Failed attempts are counted per account (login email) and per client IP in
+the shared cache, so a burst of bad logins costs cache increments rather
+than row-locking UPDATEs on the users table. Once a key reaches its limit
+it is locked out for a fixed period and further attempts are rejected
+before the user is looked up or a password is hashed.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+class SlidingWindowLimiter:
+    """
+    Approximates the number of events in the last `window` seconds from two
+    fixed buckets (the current window and the previous one, weighted by how
+    much of it still overlaps), which needs only one counter per window.
+    """
+
+    def __init__(self, prefix, limit, window, lockout):
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+
+    def lock_key(self, key):
+        return f'{self.prefix}:lock:{key}'
+
+    def bucket_key(self, key, index):
+        return f'{self.prefix}:{key}:{index}'
+
+    def count(self, key, now=None):
+        now = time.time() if now is None else now
+        index, elapsed = divmod(now, self.window)
+        index = int(index)
+        buckets = cache.get_many([self.bucket_key(key, index), self.bucket_key(key, index - 1)])
+        current = buckets.get(self.bucket_key(key, index), 0)
+        previous = buckets.get(self.bucket_key(key, index - 1), 0)
+        return current + previous * (1 - elapsed / self.window)
+
+    def hit(self, key, now=None):
+        """Record one event; returns True if this event locked the key out"""
+        now = time.time() if now is None else now
+        bucket = self.bucket_key(key, int(now // self.window))
+        # Buckets are read for one more window as the "previous" bucket
+        if not cache.add(bucket, 1, self.window * 2):
+            try:
+                cache.incr(bucket)
+            except ValueError:
+                cache.set(bucket, 1, self.window * 2)
+
+        if self.count(key, now) < self.limit:
+            return False
+        # add() so concurrent hits report the transition only once
+        return cache.add(self.lock_key(key), now + self.lockout, self.lockout)
+
+    def reset(self, key):
+        now = int(time.time() // self.window)
+        cache.delete_many([self.lock_key(key), self.bucket_key(key, now), self.bucket_key(key, now - 1)])
+
+def account_limiter():
+    return SlidingWindowLimiter(
+        'login:account', settings.ACCOUNT_LOCKOUT_ATTEMPTS, settings.ACCOUNT_LOCKOUT_TIME, settings.ACCOUNT_LOCKOUT_TIME,
+    )
+
+def ip_limiter():
+    return SlidingWindowLimiter(
+        'login:ip', settings.LOGIN_IP_ATTEMPTS, settings.LOGIN_IP_WINDOW, settings.LOGIN_IP_WINDOW,
+    )
+
+def account_key(email):
+    return email.strip().lower()
+
+def login_lockouts(email, ip):
+    """
+    Seconds until the account and the IP may try again (None if not locked),
+    read with a single cache round trip.
+    """
+    account_lock = account_limiter().lock_key(account_key(email))
+    ip_lock = ip_limiter().lock_key(ip)
+    locks = cache.get_many([account_lock, ip_lock])
+    now = time.time()
+
+    def remaining(key):
+        until = locks.get(key)
+        return max(1, int(until - now)) if until and until > now else None
+
+    return remaining(account_lock), remaining(ip_lock)
+
+def record_login_failure(email, ip):
+    """Count a failed attempt; returns True if it locked the account out"""
+    ip_limiter().hit(ip)
+    return account_limiter().hit(account_key(email))
+
+def record_login_success(email):
+    account_limiter().reset(account_key(email))
@@ -0,0 +1,190 @@
+"""
+Cache-backed JWT revocation and account lockout state.
+
+Logging out records the token's JTI in the cache until the token would have
+expired anyway; "log out everywhere" records a per-user not-before time
+instead. A login lockout records the user's locked-until time the same way.
+Checking a token is one cache round trip and never touches the database.
+
+With TOKEN_REVOCATION_BLOOM enabled, each process also keeps a Bloom filter
+of revoked JTIs/users, so tokens that were never revoked (almost all of
+them) skip the cache entirely. Revocations made by other processes reach the
+filter through a short log kept in the cache, read at most every
+TOKEN_REVOCATION_BLOOM_REFRESH seconds; that interval is how long a token
+revoked elsewhere may still be accepted here.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+REVOKED_JTI_KEY = 'revoked_jti:{jti}'
+NOT_BEFORE_KEY = 'token_not_before:{user_id}'
+LOCKOUT_KEY = 'user_locked_until:{user_id}'
+LOG_SEQUENCE_KEY = 'revocation_log_seq'
+LOG_EPOCH_KEY = 'revocation_log_epoch'
+LOG_ENTRY_KEY = 'revocation_log:{seq}'
+
+def jti_member(jti):
+    return f'jti:{jti}'
+
+def user_member(user_id):
+    return f'user:{user_id}'
+
+def lockout_member(user_id):
+    return f'lock:{user_id}'
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] >> (position & 7) & 1 for position in self._positions(value))
+
+class RevocationFilter:
+    """Process-local Bloom filter of revoked tokens, synced from the cache log"""
+
+    def __init__(self, capacity=100_000, error_rate=0.001, refresh_interval=5):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.epoch = None
+        self.last_seq = 0
+        self.next_sync = 0
+        self.next_expiry = math.inf
+
+    def add(self, member, expires):
+        with self.lock:
+            self._add(member, expires)
+
+    def might_contain(self, members):
+        self._sync()
+        return any(member in self.bloom for member in members)
+
+    def _add(self, member, expires):
+        self.entries[member] = max(expires, self.entries.get(member, 0))
+        self.next_expiry = min(self.next_expiry, expires)
+        self.bloom.add(member)
+
+    def _sync(self):
+        now = time.monotonic()
+        if now < self.next_sync:
+            return
+        with self.lock:
+            if now < self.next_sync:
+                return
+            self.next_sync = now + self.refresh_interval
+
+            state = cache.get_many([LOG_SEQUENCE_KEY, LOG_EPOCH_KEY])
+            seq, epoch = state.get(LOG_SEQUENCE_KEY, 0), state.get(LOG_EPOCH_KEY)
+            if epoch != self.epoch:
+                # The cache was flushed or the log restarted; replay it
+                self.epoch = epoch
+                self.last_seq = 0
+            if seq > self.last_seq:
+                # Entries older than the newest `capacity` are not worth replaying
+                first = max(self.last_seq + 1, seq - self.capacity + 1)
+                keys = [LOG_ENTRY_KEY.format(seq=n) for n in range(first, seq + 1)]
+                for member, expires in cache.get_many(keys).values():
+                    self._add(member, expires)
+                self.last_seq = seq
+
+            if time.time() >= self.next_expiry or len(self.entries) > self.capacity:
+                self._rebuild()
+
+    def _rebuild(self):
+        # Bloom filters cannot forget, so expired revocations are dropped by
+        # rebuilding from the entries still live
+        now = time.time()
+        live = sorted(((expires, member) for member, expires in self.entries.items() if expires > now), reverse=True)
+        self.entries = {}
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.next_expiry = math.inf
+        for expires, member in live[:self.capacity]:
+            self._add(member, expires)
+
+revocation_filter = RevocationFilter(refresh_interval=settings.TOKEN_REVOCATION_BLOOM_REFRESH)
+
+def _publish(member, ttl):
+    expires = time.time() + ttl
+    cache.add(LOG_EPOCH_KEY, uuid.uuid4().hex, None)
+    cache.add(LOG_SEQUENCE_KEY, 0, None)
+    try:
+        seq = cache.incr(LOG_SEQUENCE_KEY)
+    except ValueError:
+        cache.set(LOG_SEQUENCE_KEY, 1, None)
+        seq = 1
+    # Once the token has expired nobody needs to learn about its revocation
+    cache.set(LOG_ENTRY_KEY.format(seq=seq), (member, expires), ttl)
+    revocation_filter.add(member, expires)
+
+def revoke_token(token):
+    """Reject this token (access or refresh) for the rest of its lifetime"""
+    ttl = max(1, int(token['exp'] - time.time()))
+    jti = token[api_settings.JTI_CLAIM]
+    cache.set(REVOKED_JTI_KEY.format(jti=jti), True, ttl)
+    _publish(jti_member(jti), ttl)
+
+def revoke_user_tokens(user_id):
+    """Reject every token issued to the user before now"""
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    ttl = int(lifetime.total_seconds())
+    cache.set(NOT_BEFORE_KEY.format(user_id=user_id), int(time.time()), ttl)
+    _publish(user_member(user_id), ttl)
+
+def lock_user(user_id, locked_until):
+    """Reject the user's tokens until `locked_until` (an aware datetime)"""
+    until = locked_until.timestamp()
+    ttl = max(1, int(until - time.time()))
+    cache.set(LOCKOUT_KEY.format(user_id=user_id), until, ttl)
+    _publish(lockout_member(user_id), ttl)
+
+def unlock_user(user_id):
+    cache.delete(LOCKOUT_KEY.format(user_id=user_id))
+
+def get_token_state(token):
+    """
+    (revoked, seconds the user stays locked out or None) for a validated
+    token, from at most one cache read.
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if settings.TOKEN_REVOCATION_BLOOM and not revocation_filter.might_contain(
+            [jti_member(jti), user_member(user_id), lockout_member(user_id)]):
+        return False, None
+
+    jti_key = REVOKED_JTI_KEY.format(jti=jti)
+    not_before_key = NOT_BEFORE_KEY.format(user_id=user_id)
+    lockout_key = LOCKOUT_KEY.format(user_id=user_id)
+    values = cache.get_many([jti_key, not_before_key, lockout_key])
+
+    # iat has one-second resolution; tokens issued in the revoking second survive
+    not_before = values.get(not_before_key)
+    revoked = bool(values.get(jti_key)) or (not_before is not None and token.get('iat', 0) < not_before)
+
+    locked_until = values.get(lockout_key)
+    now = time.time()
+    locked_for = max(1, int(locked_until - now)) if locked_until and locked_until > now else None
+    return revoked, locked_for
+
+def is_revoked(token):
+    return get_token_state(token)[0]
@@ -1,11 +1,13 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 from django.contrib.auth import authenticate
-from companies.models import User, Company
-from roles.models import Role, Permission, UserRole
+from companies.models import User, Company, users_with_email
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
-from audit.utils import log_action
+from audit.utils import get_client_ip, log_action, log_anonymous_action
+from .ratelimit import login_lockouts, record_login_failure, record_login_success
+from .revocation import lock_user, unlock_user
+from roles.utils import get_effective_permissions
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -15,47 +17,56 @@ class LoginSerializer(serializers.Serializer):
         email = attrs.get('email')
         password = attrs.get('password')
         request = self.context.get('request')
+        ip = get_client_ip(request) if request else None
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        # Rejected from the cache alone: no lookup, hashing or writes
+        account_wait, ip_wait = login_lockouts(email, ip)
+        if ip_wait:
+            raise exceptions.Throttled(wait=ip_wait, detail='Too many failed login attempts')
+        if account_wait:
+            raise serializers.ValidationError('Account is temporarily locked')
+
+        user = users_with_email(email).first()
+        if user is None:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            User().set_password(password)
+            record_login_failure(email, ip)
             # Audit failed attempt for non-existent user
             if request:
-                from audit.models import AuditLog
-                AuditLog.objects.create(
-                    user=None,
-                    action='LOGIN',
-                    resource_type='User',
-                    resource_id='unknown',
-                    details=f'Failed login attempt for non-existent user: {email}',
-                    ip_address=request.META.get('REMOTE_ADDR', 'unknown'),
-                    user_agent='unknown'
-                )
+                log_anonymous_action('LOGIN', 'User', 'unknown', f'Failed login attempt for non-existent user: {email}', request)
             raise serializers.ValidationError('Invalid credentials')
 
-        # Check if account is locked
-        if user.locked_until and user.locked_until > timezone.now():
-            log_action(user, 'LOGIN', 'User', str(user.id), 'Failed login attempt - account locked', request)
+        now = timezone.now()
+
+        # Locks recorded on the row outlive a cache flush
+        if user.locked_until and user.locked_until > now:
             raise serializers.ValidationError('Account is temporarily locked')
 
-        # Authenticate user
-        authenticated_user = authenticate(username=user.username, password=password)
+        # Authenticate the user we already loaded instead of re-fetching it
+        authenticated_user = authenticate(request, user=user, password=password)
         if not authenticated_user:
-            # Increment failed attempts
-            user.failed_login_attempts += 1
-            
-            if user.failed_login_attempts >= 5:  # ACCOUNT_LOCKOUT_ATTEMPTS
-                user.locked_until = timezone.now() + timedelta(seconds=300)  # 5 minutes
-            
-            user.save()
-            log_action(user, 'LOGIN', 'User', str(user.id), f'Failed login attempt #{user.failed_login_attempts}', request)
+            # Failures are counted in the cache; the row is only written
+            # when this attempt locks the account out
+            if record_login_failure(email, ip):
+                user.failed_login_attempts = settings.ACCOUNT_LOCKOUT_ATTEMPTS
+                user.locked_until = now + timedelta(seconds=settings.ACCOUNT_LOCKOUT_TIME)
+                user.save(update_fields=['failed_login_attempts', 'locked_until'])
+                # Existing sessions are refused by the auth layer until then
+                lock_user(user.pk, user.locked_until)
+                log_action(user, 'LOGIN', 'User', str(user.id), 'Failed login attempt - account locked', request)
+            else:
+                log_action(user, 'LOGIN', 'User', str(user.id), 'Failed login attempt', request)
             raise serializers.ValidationError('Invalid credentials')
 
-        # Reset failed attempts on successful login
-        if authenticated_user.failed_login_attempts > 0:
-            authenticated_user.failed_login_attempts = 0
-            authenticated_user.locked_until = None
-            authenticated_user.save()
+        record_login_success(email)
+        if authenticated_user.locked_until is not None:
+            unlock_user(authenticated_user.pk)
+
+        # Single write: record the login and clear any previous lockout
+        authenticated_user.last_login = now
+        authenticated_user.failed_login_attempts = 0
+        authenticated_user.locked_until = None
+        authenticated_user.save(update_fields=['last_login', 'failed_login_attempts', 'locked_until'])
 
         log_action(authenticated_user, 'LOGIN', 'User', str(authenticated_user.id), 'Successful login', request)
         attrs['user'] = authenticated_user
@@ -70,15 +81,13 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'company', 'permissions', 'roles', 'is_superuser']
 
     def get_permissions(self, obj):
-        user_roles = UserRole.objects.filter(user=obj)
-        permissions = set()
-        for user_role in user_roles:
-            role_permissions = user_role.role.permissions.all()
-            permissions.update([perm.name for perm in role_permissions])
-        return list(permissions)
+        # Login passes the list it already resolved for the response
+        if 'permissions' in self.context:
+            return self.context['permissions']
+        return sorted(get_effective_permissions(obj))
 
     def get_roles(self, obj):
-        user_roles = UserRole.objects.filter(user=obj)
+        user_roles = obj.user_roles.select_related('role')
         return [{'id': ur.role.id, 'name': ur.role.name} for ur in user_roles]
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -88,9 +97,13 @@ class UserCreateSerializer(serializers.ModelSerializer):
         model = User
         fields = ['username', 'email', 'first_name', 'last_name', 'password', 'company']
 
+    def validate_email(self, value):
+        if value and users_with_email(value).exists():
+            raise serializers.ValidationError('A user with this email already exists.')
+        return value
+
     def create(self, validated_data):
         password = validated_data.pop('password')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        # Hash once and insert once
+        user = User.objects.create_user(password=password, **validated_data)
         return user
\ No newline at end of file
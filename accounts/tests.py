@@ -1,3 +1,482 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from companies.models import Company, User
+from roles.models import Permission, Role, UserRole
+from roles.utils import get_permission_version, has_permission
+from audit.models import AuditLog
+from . import views
+from . import notifications
+from .checks import check_shared_cache
+from .consumers import NotificationConsumer
+from .middleware import get_user_from_token
+from .notifications import user_group
+from .presence import connection_closed, connection_opened, online_users
+from .authentication import PermissionClaimsJWTAuthentication
+from .pool import BoundedPool, PoolSaturated
+from .revocation import RevocationFilter, is_revoked, revoke_token
+from .tokens import PermissionRefreshToken
 
-# Create your tests here.
+@override_settings(JWT_EMBED_PERMISSIONS=True)
+class PermissionClaimsTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.user = User.objects.create_user(username='alice', email='alice@acme.com', password='S3cure-pass!', company=self.company)
+        self.view_users = Permission.objects.create(name='VIEW_USERS')
+        self.assign_roles = Permission.objects.create(name='ASSIGN_ROLES')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role = Role.objects.create(name='Viewer')
+            self.role.permissions.add(self.view_users)
+            UserRole.objects.create(user=self.user, role=self.role)
+
+    def login(self):
+        response = APIClient().post('/api/auth/login/', {'email': 'alice@acme.com', 'password': 'S3cure-pass!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['access']
+
+    def authenticate(self, access):
+        request = APIRequestFactory().get('/api/users/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        return PermissionClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_fresh_token_authenticates_and_authorizes_without_queries(self):
+        access = self.login()
+
+        with self.assertNumQueries(0):
+            user = self.authenticate(access)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.company_id, self.company.pk)
+            self.assertTrue(has_permission(user, 'VIEW_USERS'))
+            self.assertFalse(has_permission(user, 'ASSIGN_ROLES'))
+
+    def test_role_change_makes_token_fall_back_to_database(self):
+        access = self.login()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            editor = Role.objects.create(name='Editor')
+            editor.permissions.add(self.assign_roles)
+            UserRole.objects.create(user=self.user, role=editor)
+
+        with self.assertNumQueries(1):
+            user = self.authenticate(access)
+        self.assertTrue(has_permission(user, 'ASSIGN_ROLES'))
+
+    def test_deactivated_user_is_rejected(self):
+        access = self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate(access)
+        self.assertEqual(raised.exception.detail['code'], 'user_inactive')
+
+    @override_settings(JWT_EMBED_PERMISSIONS=False)
+    def test_plain_tokens_use_database_lookup(self):
+        access = self.login()
+        with self.assertNumQueries(1):
+            self.authenticate(access)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='Alice@Acme.com', password='S3cure-pass!')
+        self.client = APIClient()
+
+    def login(self, email='alice@acme.com', password='S3cure-pass!'):
+        return self.client.post('/api/auth/login/', {'email': email, 'password': password}, format='json')
+
+    def test_email_lookup_is_case_insensitive_and_unique(self):
+        self.assertEqual(self.login(email='ALICE@acme.com').status_code, 200)
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(username='alice2', email='alice@ACME.com')
+
+    def test_successful_login_writes_once_and_audits_once(self):
+        version = get_permission_version(self.user.pk)
+        response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(AuditLog.objects.filter(user=self.user, action='LOGIN').count(), 1)
+        # Login bookkeeping must not invalidate cached permissions or tokens
+        self.assertEqual(get_permission_version(self.user.pk), version)
+
+    def test_failed_logins_are_counted_and_lock_the_account(self):
+        for _ in range(5):
+            self.assertEqual(self.login(password='wrong').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 5)
+        self.assertIsNotNone(self.user.locked_until)
+
+        # Rejected from the cache before the user is even looked up
+        with self.assertNumQueries(0):
+            response = self.login()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Account is temporarily locked', str(response.data))
+
+    def test_lockout_rejects_existing_sessions_without_queries(self):
+        access = str(PermissionRefreshToken.for_user(self.user).access_token)
+        for _ in range(5):
+            self.login(password='wrong')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 423)
+        self.assertIn('Retry-After', response)
+
+    def test_failures_below_the_limit_do_not_write_the_user_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(4):
+                self.login(password='wrong')
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "companies_user"')])
+
+        self.assertEqual(self.login().status_code, 200)
+        # A success clears the window, so four more failures do not lock
+        for _ in range(4):
+            self.login(password='wrong')
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(LOGIN_IP_ATTEMPTS=3)
+    def test_client_ip_is_throttled_across_accounts(self):
+        for i in range(3):
+            self.login(email=f'nobody{i}@acme.com', password='wrong')
+
+        with self.assertNumQueries(0):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+@override_settings(PASSWORD_HASHERS=['accounts.hashers.TunablePBKDF2PasswordHasher'], PASSWORD_HASH_ITERATIONS=1000)
+class PasswordPolicyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@acme.com', password='S3cure-pass!')
+
+    def test_hasher_uses_configured_iterations(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_policy_change_rehashes_on_login(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            response = APIClient().post('/api/auth/login/', {'email': 'alice@acme.com', 'password': 'S3cure-pass!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+class LoginPoolTests(TestCase):
+    def occupy(self, pool):
+        release = threading.Event()
+        started = threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+        future = pool.submit(block)
+        started.wait(5)
+        return release, future
+
+    def test_pool_refuses_work_beyond_its_queue(self):
+        pool = BoundedPool(workers=1, queue_size=1)
+        release, running = self.occupy(pool)
+        queued = pool.submit(lambda: 'queued')
+        with self.assertRaises(PoolSaturated):
+            pool.submit(lambda: 'refused')
+
+        release.set()
+        running.result(5)
+        self.assertEqual(queued.result(5), 'queued')
+        self.assertEqual(pool.submit(lambda: 'accepted').result(5), 'accepted')
+
+    @override_settings(LOGIN_POOL_MODE='pool')
+    def test_saturated_pool_returns_429_without_queries(self):
+        pool = BoundedPool(workers=1, queue_size=0)
+        release, running = self.occupy(pool)
+        try:
+            with mock.patch.object(views, 'login_pool', pool), self.assertNumQueries(0):
+                response = APIClient().post('/api/auth/login/', {'email': 'alice@acme.com', 'password': 'x'}, format='json')
+        finally:
+            release.set()
+            running.result(5)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@acme.com')
+
+    def issue(self):
+        refresh = PermissionRefreshToken.for_user(self.user)
+        return refresh, str(refresh.access_token)
+
+    def get(self, access):
+        return APIClient().get('/api/auth/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        refresh, access = self.issue()
+        self.assertEqual(self.get(access).status_code, 200)
+
+        response = APIClient().post('/api/auth/logout/', {'refresh': str(refresh)}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(access).status_code, 401)
+        self.assertTrue(is_revoked(refresh))
+
+        # Other sessions are unaffected
+        _, other = self.issue()
+        self.assertEqual(self.get(other).status_code, 200)
+
+    def test_logout_everywhere_revokes_earlier_tokens(self):
+        _, first = self.issue()
+        _, second = self.issue()
+        with mock.patch('time.time', return_value=time.time() + 1):
+            APIClient().post('/api/auth/logout/', {'everywhere': True}, format='json', HTTP_AUTHORIZATION=f'Bearer {first}')
+        self.assertEqual(self.get(second).status_code, 401)
+
+    def test_revocation_check_does_not_query_database(self):
+        refresh, _ = self.issue()
+        with self.assertNumQueries(0):
+            self.assertFalse(is_revoked(refresh.access_token))
+            revoke_token(refresh)
+            self.assertTrue(is_revoked(refresh))
+
+    def test_bloom_filter_learns_revocations_from_other_processes(self):
+        refresh, _ = self.issue()
+        other_process = RevocationFilter(capacity=1000, refresh_interval=0)
+        member = f"jti:{refresh['jti']}"
+        self.assertFalse(other_process.might_contain([member]))
+
+        revoke_token(refresh)
+        self.assertTrue(other_process.might_contain([member]))
+        self.assertFalse(other_process.might_contain(['jti:never-revoked']))
+
+    @override_settings(TOKEN_REVOCATION_BLOOM=True)
+    def test_bloom_filter_skips_cache_for_unrevoked_tokens(self):
+        refresh, _ = self.issue()
+        with mock.patch('accounts.revocation.revocation_filter', RevocationFilter(capacity=1000, refresh_interval=60)):
+            revoke_token(refresh)
+            self.assertTrue(is_revoked(refresh))
+
+            with mock.patch('accounts.revocation.cache') as cache_mock:
+                self.assertFalse(is_revoked(refresh.access_token))
+            cache_mock.get_many.assert_not_called()
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SharedCacheCheckTests(TestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    REDIS = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+
+    def test_process_local_cache_is_an_error_in_production(self):
+        with override_settings(CACHES=self.LOCMEM, DEBUG=False, TESTING=False):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['accounts.E001'])
+        with override_settings(CACHES=self.LOCMEM, DEBUG=True, TESTING=False):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=self.REDIS, DEBUG=False, TESTING=False):
+            self.assertEqual(check_shared_cache(None), [])
+
+class PermissionNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.layer = get_channel_layer()
+        self.users = [User.objects.create_user(username=f'user{i}', email=f'user{i}@acme.com') for i in range(3)]
+        self.roles = [Role.objects.create(name=f'Role {i}') for i in range(4)]
+        self.view_users = Permission.objects.create(name='VIEW_USERS')
+        self.channels = {}
+        for user in self.users:
+            channel = async_to_sync(self.layer.new_channel)()
+            async_to_sync(self.layer.group_add)(user_group(user.pk), channel)
+            connection_opened(user.pk)
+            self.channels[user.pk] = channel
+
+    def receive_all(self, channel):
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def test_bulk_role_changes_send_one_message_per_user(self):
+        alice, bob, _ = self.users
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for role in self.roles:
+                    UserRole.objects.create(user=alice, role=role)
+                UserRole.objects.create(user=bob, role=self.roles[0])
+                self.roles[0].permissions.add(self.view_users)
+                # Nothing is sent before commit
+                self.assertEqual(self.receive_all(self.channels[alice.pk]), [])
+        self.assertTrue(callbacks)
+
+        for user in (alice, bob):
+            messages = self.receive_all(self.channels[user.pk])
+            self.assertEqual(len(messages), 1)
+            self.assertEqual(messages[0]['type'], 'permission_update')
+            self.assertEqual(messages[0]['permissions'], ['VIEW_USERS'])
+            self.assertIn([self.roles[0].pk, 1 << self.view_users.bit], messages[0]['roles'])
+        # Users whose permissions did not change hear nothing
+        self.assertEqual(self.receive_all(self.channels[self.users[2].pk]), [])
+
+    def test_offline_users_cost_nothing(self):
+        offline = User.objects.create_user(username='offline', email='offline@acme.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.build_messages([offline.pk], []), [])
+
+        connection_closed(self.users[0].pk)
+        self.assertEqual(online_users([user.pk for user in self.users]), [self.users[1].pk, self.users[2].pk])
+
+    def test_rolled_back_changes_are_not_sent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    UserRole.objects.create(user=self.users[0], role=self.roles[0])
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(self.receive_all(self.channels[self.users[0].pk]), [])
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RoleBroadcastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Committed (and sent) before any socket connects
+        with self.captureOnCommitCallbacks(execute=True):
+            self.view_users = Permission.objects.create(name='VIEW_USERS')
+            self.create_user = Permission.objects.create(name='CREATE_USER')
+            self.viewer = Role.objects.create(name='Viewer')
+            self.viewer.permissions.add(self.view_users)
+            self.editor = Role.objects.create(name='Editor')
+            self.holders = [User.objects.create_user(username=f'user{i}', email=f'user{i}@acme.com') for i in range(3)]
+            for user in self.holders:
+                UserRole.objects.create(user=user, role=self.viewer)
+
+    def commit(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    async def connect(self, user):
+        # channels.testing needs daphne, so drive the ASGI protocol directly
+        scope = {'type': 'websocket', 'path': '/ws/notifications/', 'user': user}
+        socket = ApplicationCommunicator(NotificationConsumer.as_asgi(), scope)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(1))['type'], 'websocket.accept')
+        return socket
+
+    async def receive(self, socket):
+        message = await socket.receive_output(1)
+        self.assertEqual(message['type'], 'websocket.send')
+        return json.loads(message['text'])
+
+    async def disconnect(self, socket):
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(1)
+
+    async def test_role_change_is_one_broadcast_merged_by_each_socket(self):
+        sockets = [await self.connect(user) for user in self.holders]
+        with mock.patch.object(notifications, 'send_messages', wraps=notifications.send_messages) as send:
+            await sync_to_async(self.commit)(lambda: self.viewer.permissions.set([self.view_users, self.create_user]))
+
+        self.assertEqual([group for group, _ in send.call_args.args[0]], [f'role_{self.viewer.pk}'])
+        for socket in sockets:
+            message = await self.receive(socket)
+            self.assertEqual((message['added'], message['removed']), (['CREATE_USER'], []))
+            await self.disconnect(socket)
+
+    async def test_socket_follows_role_assignments(self):
+        user = self.holders[0]
+        socket = await self.connect(user)
+
+        # Editor grants nothing yet, so there is no delta to send
+        await sync_to_async(self.commit)(lambda: UserRole.objects.create(user=user, role=self.editor))
+        self.assertTrue(await socket.receive_nothing())
+
+        await sync_to_async(self.commit)(lambda: self.editor.permissions.add(self.create_user))
+        self.assertEqual((await self.receive(socket))['added'], ['CREATE_USER'])
+
+        await sync_to_async(self.commit)(lambda: UserRole.objects.filter(user=user, role=self.viewer).delete())
+        self.assertEqual((await self.receive(socket))['removed'], ['VIEW_USERS'])
+
+        # Left the Viewer group, so its broadcasts no longer reach this socket
+        await sync_to_async(self.commit)(lambda: self.viewer.permissions.clear())
+        self.assertTrue(await socket.receive_nothing())
+        await self.disconnect(socket)
+
+    async def test_sockets_are_counted_while_open(self):
+        user = self.holders[0]
+        sockets = [await self.connect(user), await self.connect(user)]
+        await self.disconnect(sockets.pop())
+        self.assertEqual(await sync_to_async(online_users)([user.pk]), [user.pk])
+        await self.disconnect(sockets.pop())
+        self.assertEqual(await sync_to_async(online_users)([user.pk]), [])
+
+    async def test_deltas_are_sequenced_and_resync_returns_full_set(self):
+        socket = await self.connect(self.holders[0])
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'resync'})})
+        sync = await self.receive(socket)
+        self.assertEqual((sync['type'], sync['permissions']), ('permissionSync', ['VIEW_USERS']))
+
+        await sync_to_async(self.commit)(lambda: self.viewer.permissions.add(self.create_user))
+        first = await self.receive(socket)
+        await sync_to_async(self.commit)(lambda: self.viewer.permissions.remove(self.view_users))
+        second = await self.receive(socket)
+
+        # Each delta applies on top of the previous version
+        self.assertEqual(first['baseVersion'], sync['version'])
+        self.assertEqual(second['baseVersion'], first['version'])
+        self.assertLess(first['version'], second['version'])
+
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'resync'})})
+        sync = await self.receive(socket)
+        self.assertEqual((sync['version'], sync['permissions']), (second['version'], ['CREATE_USER']))
+        await self.disconnect(socket)
+
+class WebSocketAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@acme.com')
+
+    def authenticate(self, token):
+        return async_to_sync(get_user_from_token)(str(token))
+
+    @override_settings(JWT_EMBED_PERMISSIONS=True)
+    def test_current_claims_need_no_queries(self):
+        access = PermissionRefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(access).pk, self.user.pk)
+
+    def test_user_snapshot_is_cached_until_the_user_changes(self):
+        access = PermissionRefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(1):
+            self.authenticate(access)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(access).email, 'alice@acme.com')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = 'alice@example.com'
+            self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(access).email, 'alice@example.com')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertTrue(self.authenticate(access).is_anonymous)
+
+    def test_revoked_token_is_anonymous(self):
+        access = PermissionRefreshToken.for_user(self.user).access_token
+        revoke_token(access)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.authenticate(access).is_anonymous)
@@ -0,0 +1,34 @@
+from django.conf import settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from roles.utils import get_effective_mask, get_permission_versions
+
+PERMISSION_MASK_CLAIM = 'perm_mask'
+PERMISSION_VERSION_CLAIM = 'perm_version'
+CATALOG_VERSION_CLAIM = 'perm_catalog'
+
+# Identity fields copied into the token so requests can be served without
+# loading the User row
+USER_CLAIMS = ['username', 'email', 'first_name', 'last_name', 'company_id', 'is_active', 'is_superuser', 'is_staff']
+
+class PermissionRefreshToken(RefreshToken):
+    """
+    Refresh token that, when JWT_EMBED_PERMISSIONS is enabled, also carries
+    the user's effective permission mask and the permission versions it was
+    computed at. The claims are copied into the derived access token.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+
+        if settings.JWT_EMBED_PERMISSIONS:
+            # Read versions before the mask so a concurrent role change can
+            # only make the token look stale, never fresher than it is
+            catalog_version, version = get_permission_versions(user.pk)
+            token[CATALOG_VERSION_CLAIM] = catalog_version
+            token[PERMISSION_VERSION_CLAIM] = version
+            token[PERMISSION_MASK_CLAIM] = get_effective_mask(user)
+            for field in USER_CLAIMS:
+                token[field] = getattr(user, field)
+
+        return token
@@ -2,7 +2,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('login/', views.login_view, name='login'),
+    path('login/', views.async_login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('me/', views.current_user, name='current_user'),
 ]
\ No newline at end of file
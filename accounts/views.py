@@ -1,86 +1,95 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import logout
 from .serializers import LoginSerializer, UserSerializer, UserCreateSerializer
-from companies.models import User
-from roles.models import UserRole
-from audit.models import AuditLog
+from .pool import PoolSaturated, login_pool
+from .revocation import revoke_token, revoke_user_tokens
+from .tokens import PERMISSION_MASK_CLAIM, PermissionRefreshToken
+from roles.utils import get_effective_mask, get_effective_permissions, mask_to_names
 from audit.utils import log_action
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def login_view(request):
-    serializer = LoginSerializer(data=request.data)
+    serializer = LoginSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
+        # The serializer has already recorded the login and audited it
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
         
-        # Reset failed login attempts on successful login
-        user.failed_login_attempts = 0
-        user.locked_until = None
-        user.save()
+        # Issued after saving so embedded permission claims are current
+        refresh = PermissionRefreshToken.for_user(user)
         
-        # Get effective permissions (computed union of all assigned roles)
-        if user.is_superuser:
-            # Superusers get all permissions
-            from roles.models import Permission
-            all_permissions = Permission.objects.all()
-            permissions_list = [perm.name for perm in all_permissions]
-        else:
-            # Regular users get role-based permissions
-            user_roles = UserRole.objects.filter(user=user)
-            permissions_list = set()
-            for user_role in user_roles:
-                role_permissions = user_role.role.permissions.all()
-                permissions_list.update([perm.name for perm in role_permissions])
-            permissions_list = list(permissions_list)
-        
-        # Log successful login
-        log_action(user, 'LOGIN', 'User', str(user.id), 'User logged in successfully', request)
+        # Resolve effective permissions once, reusing the token's mask if embedded
+        mask = refresh.get(PERMISSION_MASK_CLAIM)
+        if mask is None:
+            mask = get_effective_mask(user)
+        permissions_list = mask_to_names(mask)
         
         return Response({
             'access': str(refresh.access_token),
             'refresh': str(refresh),
-            'user': UserSerializer(user).data,
+            'user': UserSerializer(user, context={'permissions': permissions_list}).data,
             'permissions': permissions_list
         })
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def render_login(request):
+    return login_view(request).render()
+
+@csrf_exempt
+async def async_login_view(request):
+    """
+    Login entry point. Password verification is CPU-bound, so the whole login
+    runs in the bounded login pool instead of on the event loop (or the
+    single thread ASGI uses for sync views); a saturated pool sheds the
+    request with a 429 before any work is done.
+    """
+    if settings.LOGIN_POOL_MODE == 'inline':
+        return await sync_to_async(render_login)(request)
+    
+    try:
+        future = login_pool.submit(render_login, request)
+    except PoolSaturated:
+        response = JsonResponse({'detail': 'Too many concurrent logins, please retry.'}, status=429)
+        response['Retry-After'] = '1'
+        return response
+    return await asyncio.wrap_future(future)
+
 @api_view(['POST'])
 def logout_view(request):
-    try:
-        refresh_token = request.data.get("refresh")
-        if refresh_token:
+    """Revoke the access token in use and the given refresh token ("everywhere": revoke all)"""
+    # The access token that authenticated this request
+    if request.auth is not None:
+        revoke_token(request.auth)
+    
+    refresh_token = request.data.get("refresh")
+    if refresh_token:
+        try:
             token = RefreshToken(refresh_token)
-            token.blacklist()
-        
-        # Log logout
-        if request.user and request.user.is_authenticated:
-            log_action(request.user, 'LOGOUT', 'User', str(request.user.id), 'User logged out', request)
-        
-        return Response({'message': 'Successfully logged out'})
-    except Exception as e:
-        return Response({'message': 'Logged out successfully'})
+        except TokenError:
+            token = None
+        if token is not None and str(token.get(api_settings.USER_ID_CLAIM)) == str(request.user.pk):
+            revoke_token(token)
+    
+    if request.data.get("everywhere"):
+        revoke_user_tokens(request.user.pk)
+    
+    log_action(request.user, 'LOGOUT', 'User', str(request.user.id), 'User logged out', request)
+    return Response({'message': 'Successfully logged out'})
 
 @api_view(['GET'])
 def current_user(request):
     user = request.user
     # Get user permissions
-    if user.is_superuser:
-        # Superusers get all permissions
-        from roles.models import Permission
-        all_permissions = Permission.objects.all()
-        permissions_list = [perm.name for perm in all_permissions]
-    else:
-        # Regular users get role-based permissions
-        user_roles = UserRole.objects.filter(user=user)
-        permissions_list = set()
-        for user_role in user_roles:
-            role_permissions = user_role.role.permissions.all()
-            permissions_list.update([perm.name for perm in role_permissions])
-        permissions_list = list(permissions_list)
+    permissions_list = sorted(get_effective_permissions(user))
     
     return Response({
         'user': UserSerializer(user).data,
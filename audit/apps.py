@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class AuditConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'audit'
\ No newline at end of file
+    name = 'audit'
+
+    def ready(self):
+        from . import signals  # noqa: F401
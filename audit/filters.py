@@ -1,21 +1,50 @@
 import django_filters
-from django.db.models import Q
-from .models import AuditLog
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import AuditActivityRollup, AuditLog
+
+def start_of_day(value):
+    return timezone.make_aware(datetime.combine(value, time.min))
 
 class AuditLogFilter(django_filters.FilterSet):
-    action = django_filters.CharFilter(field_name='action', lookup_expr='iexact')
+    action = django_filters.CharFilter(method='filter_action')
     user = django_filters.CharFilter(method='filter_user')
-    start_date = django_filters.DateFilter(field_name='timestamp', lookup_expr='gte')
-    end_date = django_filters.DateFilter(field_name='timestamp', lookup_expr='lte')
+    start_date = django_filters.DateFilter(method='filter_start_date')
+    end_date = django_filters.DateFilter(method='filter_end_date')
     
     class Meta:
         model = AuditLog
         fields = ['action', 'user', 'start_date', 'end_date']
     
+    def filter_action(self, queryset, name, value):
+        # Actions are stored upper-case; an exact match (unlike iexact) can
+        # use the (company, action, timestamp) index
+        return queryset.filter(action=value.upper())
+    
+    # Dates become plain timestamp bounds so the (company, timestamp) index
+    # and monthly partition pruning both apply
+    def filter_start_date(self, queryset, name, value):
+        return queryset.filter(timestamp__gte=start_of_day(value))
+    
+    def filter_end_date(self, queryset, name, value):
+        # Inclusive of the whole end day
+        return queryset.filter(timestamp__lt=start_of_day(value + timedelta(days=1)))
+    
     def filter_user(self, queryset, name, value):
-        return queryset.filter(
-            Q(user__username__icontains=value) | 
-            Q(user__email__icontains=value) |
-            Q(user__first_name__icontains=value) |
-            Q(user__last_name__icontains=value)
-        )
\ No newline at end of file
+        # user_search is stored lower-cased, so a plain substring match is
+        # case-insensitive and can use the trigram index on PostgreSQL
+        return queryset.filter(user_search__contains=value.lower())
+
+class AuditActivityRollupFilter(django_filters.FilterSet):
+    start_date = django_filters.DateFilter(field_name='day', lookup_expr='gte')
+    end_date = django_filters.DateFilter(field_name='day', lookup_expr='lte')
+    action = django_filters.CharFilter(method='filter_action')
+    resource_type = django_filters.CharFilter(field_name='resource_type')
+    
+    class Meta:
+        model = AuditActivityRollup
+        fields = ['start_date', 'end_date', 'action', 'resource_type']
+    
+    def filter_action(self, queryset, name, value):
+        # Comma-separated, e.g. ?action=login,create,delete
+        return queryset.filter(action__in=[action.strip().upper() for action in value.split(',') if action.strip()])
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from audit import partitions
+
+class Command(BaseCommand):
+    help = 'Create upcoming audit log partitions and prune audit history past its retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD,
+                            help='Number of future monthly partitions to keep ready')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Maximum rows removed per DELETE when pruning row by row')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Detach expired partitions but keep their tables (e.g. for archiving)')
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the existing audit table into a partitioned table')
+
+    def handle(self, *args, **options):
+        cutoffs, keeps_forever = partitions.retention_cutoffs()
+
+        if settings.AUDIT_PARTITIONING and partitions.partitioning_supported():
+            if not partitions.is_partitioned():
+                if options['convert']:
+                    partitions.convert_to_partitioned()
+                    self.stdout.write('Converted audit log table to monthly partitions')
+                else:
+                    self.stdout.write(self.style.WARNING(
+                        'AUDIT_PARTITIONING is enabled but the audit table is not partitioned; '
+                        'run with --convert to migrate it'
+                    ))
+
+            if partitions.is_partitioned():
+                for name in partitions.ensure_partitions(options['months_ahead']):
+                    self.stdout.write(f'Created partition: {name}')
+
+                horizon = partitions.partition_horizon(cutoffs, keeps_forever)
+                if horizon is not None:
+                    for name in partitions.drop_partitions_before(horizon, options['detach_only']):
+                        action = 'Detached' if options['detach_only'] else 'Dropped'
+                        self.stdout.write(f'{action} expired partition: {name}')
+
+        # Whatever partitions could not remove (shorter per-company retention,
+        # unpartitioned tables, SQLite) is deleted in bounded chunks
+        deleted = partitions.delete_expired_rows(cutoffs, options['chunk_size'])
+        self.stdout.write(f'Deleted {deleted} expired audit log rows')
+
+        self.stdout.write(self.style.SUCCESS('Audit log maintenance completed'))
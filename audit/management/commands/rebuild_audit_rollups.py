@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from audit.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Recompute audit activity rollups from the raw audit log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD) onwards')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        buckets = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} audit activity rollup buckets'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0003_alter_auditlog_company'),
+        ('companies', '0003_alter_company_options_alter_company_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='auditlog',
+            options={'ordering': ['-timestamp', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='audit_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0004_auditlog_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0005_auditlog_timestamp_default'),
+        ('companies', '0003_alter_company_options_alter_company_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='company',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='companies.company'),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', '-timestamp', '-id'], name='audit_company_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['company', 'action', '-timestamp', '-id'], name='audit_company_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='audit_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+def backfill_user_search(apps, schema_editor):
+    AuditLog = apps.get_model('audit', 'AuditLog')
+    User = apps.get_model('companies', 'User')
+
+    user_ids = AuditLog.objects.exclude(user=None).values_list('user_id', flat=True).distinct()
+    for user in User.objects.filter(id__in=user_ids).iterator():
+        values = [user.username, user.email, user.first_name, user.last_name]
+        search = ' '.join(value for value in values if value).lower()
+        AuditLog.objects.filter(user_id=user.id).update(user_search=search)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS audit_user_search_trgm_idx '
+        'ON audit_auditlog USING gin (user_search gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS audit_user_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0006_auditlog_composite_indexes'),
+        ('companies', '0003_alter_company_options_alter_company_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='user_search',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_user_search, migrations.RunPython.noop),
+        # Substring search on PostgreSQL; other backends keep a (correct) scan
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    AuditLog = apps.get_model('audit', 'AuditLog')
+    AuditActivityRollup = apps.get_model('audit', 'AuditActivityRollup')
+
+    rows = (
+        AuditLog.objects.order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('company_id', 'day', 'action', 'resource_type')
+        .annotate(total=Count('id'))
+    )
+    AuditActivityRollup.objects.bulk_create(
+        [AuditActivityRollup(company_id=row['company_id'], day=row['day'], action=row['action'],
+                             resource_type=row['resource_type'], count=row['total']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0007_auditlog_user_search'),
+        ('companies', '0004_company_audit_retention_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('action', models.CharField(choices=[('CREATE', 'Create'), ('UPDATE', 'Update'), ('DELETE', 'Delete'), ('LOGIN', 'Login'), ('LOGOUT', 'Logout'), ('LOGIN_FAILED', 'Login Failed')], max_length=20)),
+                ('resource_type', models.CharField(max_length=50)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('company', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='companies.company')),
+            ],
+            options={
+                'ordering': ['day', 'action', 'resource_type'],
+                'indexes': [models.Index(fields=['company', 'day', 'action', 'resource_type'], name='audit_rollup_bucket_idx'), models.Index(fields=['day'], name='audit_rollup_day_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
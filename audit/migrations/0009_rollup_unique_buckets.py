@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:22
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_buckets(apps, schema_editor):
+    AuditActivityRollup = apps.get_model('audit', 'AuditActivityRollup')
+
+    duplicates = (
+        AuditActivityRollup.objects.order_by()
+        .values('company_id', 'day', 'action', 'resource_type')
+        .annotate(rows=Count('id'), total=Sum('count'))
+        .filter(rows__gt=1)
+    )
+    for bucket in duplicates:
+        rows = AuditActivityRollup.objects.filter(
+            company_id=bucket['company_id'], day=bucket['day'],
+            action=bucket['action'], resource_type=bucket['resource_type'],
+        ).order_by('id')
+        keep = rows.first()
+        rows.exclude(pk=keep.pk).delete()
+        AuditActivityRollup.objects.filter(pk=keep.pk).update(count=bucket['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0008_auditactivityrollup'),
+        ('companies', '0005_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_buckets, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='auditactivityrollup',
+            name='audit_rollup_bucket_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='auditactivityrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', False)), fields=('company', 'day', 'action', 'resource_type'), name='audit_rollup_bucket_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='auditactivityrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('day', 'action', 'resource_type'), name='audit_rollup_platform_bucket_uniq'),
+        ),
+    ]
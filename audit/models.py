@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from companies.models import User, Company
 
 class AuditLog(models.Model):
@@ -11,18 +12,66 @@ class AuditLog(models.Model):
         ('LOGIN_FAILED', 'Login Failed'),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    # Single-column FK indexes are covered by the composite indexes below
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     resource_type = models.CharField(max_length=50)
     resource_id = models.CharField(max_length=50, blank=True)
     details = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Lower-cased "username email first last" of the actor, copied at write
+    # time so the user filter needs no join (trigram-indexed on PostgreSQL)
+    user_search = models.TextField(blank=True, default='', editable=False)
+    # Set when the event happens, not when the batched writer flushes it
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
+        indexes = [
+            # Seek index for keyset pagination
+            models.Index(fields=['-timestamp', '-id'], name='audit_timestamp_id_idx'),
+            # Tenant-scoped listing, optionally narrowed by action or date range
+            models.Index(fields=['company', '-timestamp', '-id'], name='audit_company_ts_idx'),
+            models.Index(fields=['company', 'action', '-timestamp', '-id'], name='audit_company_action_ts_idx'),
+            # Per-user history and SET_NULL on user deletion
+            models.Index(fields=['user', '-timestamp', '-id'], name='audit_user_ts_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user} - {self.action} - {self.resource_type}"
\ No newline at end of file
+        return f"{self.user} - {self.action} - {self.resource_type}"
+
+class AuditActivityRollup(models.Model):
+    """
+    Daily event counts per (company, day, action, resource_type), kept up to
+    date by the audit writer so dashboards never aggregate raw audit rows.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+    day = models.DateField()
+    action = models.CharField(max_length=20, choices=AuditLog.ACTION_CHOICES)
+    resource_type = models.CharField(max_length=50)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'action', 'resource_type']
+        indexes = [
+            models.Index(fields=['day'], name='audit_rollup_day_idx'),
+        ]
+        # One row per bucket; NULL companies (platform events) need their own
+        # constraint because NULLs never conflict in a plain unique index
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'day', 'action', 'resource_type'],
+                condition=models.Q(company__isnull=False),
+                name='audit_rollup_bucket_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'action', 'resource_type'],
+                condition=models.Q(company__isnull=True),
+                name='audit_rollup_platform_bucket_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} - {self.day} - {self.action} {self.resource_type}: {self.count}"
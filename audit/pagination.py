@@ -0,0 +1,121 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (timestamp, id).
+
+    Each page is fetched with a seek predicate on the composite key instead of
+    an OFFSET, and no COUNT(*) is issued, so deep pages cost the same as the
+    first one. Cursors are opaque to clients.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        descending = self.is_descending(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        # Walking backwards means seeking the other way and flipping the page
+        seek_descending = descending != reverse
+        prefix = '-' if seek_descending else ''
+        queryset = queryset.order_by(f'{prefix}timestamp', f'{prefix}id')
+        if position is not None:
+            timestamp, pk = position
+            if seek_descending:
+                queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            # We arrived from a later page, so there is always a next one
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_position = self.previous_position = None
+        if rows and has_next:
+            self.next_position = (rows[-1].timestamp, rows[-1].id)
+        if rows and has_previous:
+            self.previous_position = (rows[0].timestamp, rows[0].id)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def is_descending(self, queryset):
+        # Follow the direction chosen by OrderingFilter (or the model default)
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return not ordering or str(ordering[0]).startswith('-')
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        timestamp, pk = position
+        payload = json.dumps({'t': timestamp.isoformat(), 'i': pk, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            timestamp = parse_datetime(payload['t'])
+            pk = int(payload['i'])
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (timestamp, pk), reverse
+
+    def to_html(self):
+        return ''
@@ -0,0 +1,213 @@
+"""
+Monthly range partitioning of the audit table (PostgreSQL only) and
+retention pruning.
+
+With AUDIT_PARTITIONING enabled, ``audit_auditlog`` is a table partitioned by
+``timestamp`` month, so date-filtered queries only touch the matching
+partitions and expired months are removed by detaching and dropping a
+partition instead of deleting rows. Everything else (SQLite, unpartitioned
+PostgreSQL, companies with a shorter retention than the partition horizon)
+falls back to deleting expired rows in bounded chunks.
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from companies.models import Company
+from .models import AuditLog
+
+TABLE = AuditLog._meta.db_table
+LEGACY_TABLE = f'{TABLE}_legacy'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+def sql_timestamp(value):
+    # Partition bounds are DDL, which cannot take bind parameters
+    return f"'{value.isoformat()}'"
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+def partitioning_supported():
+    return connection.vendor == 'postgresql'
+
+def is_partitioned():
+    if not partitioning_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+def convert_to_partitioned():
+    """
+    Turn the plain audit table into a partitioned one without copying rows:
+    the existing table is attached as a single historical partition covering
+    everything up to the end of the month of its newest row (or up to the
+    current month if it is empty).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        # ATTACH PARTITION validates every existing row against the bound
+        cursor.execute(f'SELECT MAX("timestamp") FROM {TABLE}')
+        newest = cursor.fetchone()[0]
+        upper = month_start(timezone.now())
+        if newest is not None:
+            upper = max(upper, add_months(month_start(newest), 1))
+
+        # Capture index and foreign key definitions before renaming
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s))",
+            [TABLE, TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE}')
+        next_id = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {name}_legacy')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY '
+            f'INCLUDING CONSTRAINTS) PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id RESTART WITH {int(next_id)}')
+        cursor.execute(f'ALTER TABLE {LEGACY_TABLE} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+
+        for name, definition in indexes:
+            definition = re.sub(rf'ON (\w+\.)?{LEGACY_TABLE}\b', f'ON {TABLE}', definition)
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name}_p {definition}')
+
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_TABLE} '
+            f'FOR VALUES FROM (MINVALUE) TO ({sql_timestamp(upper)})'
+        )
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+def list_partitions():
+    """[(name, lower bound or None, upper bound)] of the monthly and legacy partitions"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = re.search(r"FROM \((.+?)\) TO \('(.+?)'\)", bound or '')
+        if not match:
+            continue  # the default partition
+        lower = None if match.group(1) == 'MINVALUE' else datetime.fromisoformat(match.group(1).strip("'"))
+        upper = datetime.fromisoformat(match.group(2))
+        partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[2])
+
+def ensure_partitions(months_ahead):
+    """
+    Create partitions for the current month and the next `months_ahead`
+    months, skipping months the legacy partition already covers.
+    """
+    partitions = list_partitions()
+    existing = {name for name, _, _ in partitions}
+    current = month_start(timezone.now())
+    end = add_months(current, months_ahead + 1)
+    # The legacy partition (no lower bound) may reach past the current month
+    legacy_end = [bound for _, start, bound in partitions if start is None]
+    lower = max([current] + legacy_end)
+    created = []
+    while lower < end:
+        upper = add_months(lower, 1)
+        name = partition_name(lower)
+        if name in existing:
+            lower = upper
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Rows that landed in the default partition for this month must
+            # move into the new partition before it can be attached
+            cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s '
+                f'RETURNING *) INSERT INTO {name} SELECT * FROM moved',
+                [lower, upper],
+            )
+            cursor.execute(
+                f'ALTER TABLE {TABLE} ATTACH PARTITION {name} '
+                f'FOR VALUES FROM ({sql_timestamp(lower)}) TO ({sql_timestamp(upper)})'
+            )
+        created.append(name)
+        lower = upper
+    return created
+
+def drop_partitions_before(horizon, detach_only=False):
+    """Detach (and drop) every partition whose rows are all older than `horizon`"""
+    removed = []
+    for name, _, upper in list_partitions():
+        if upper > horizon:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            if not detach_only:
+                cursor.execute(f'DROP TABLE {name}')
+        removed.append(name)
+    return removed
+
+def retention_cutoffs(now=None):
+    """
+    Return ({company_id: cutoff}, keeps_forever). Rows older than their
+    company's cutoff are expired; key None covers rows without a company.
+    keeps_forever is True if any policy never expires rows.
+    """
+    now = now or timezone.now()
+    default_days = settings.AUDIT_RETENTION_DAYS
+    cutoffs = {}
+    keeps_forever = default_days is None
+    if default_days is not None:
+        cutoffs[None] = now - timedelta(days=default_days)
+    for company_id, days in Company.objects.values_list('id', 'audit_retention_days'):
+        days = days if days is not None else default_days
+        if days is None:
+            keeps_forever = True
+        else:
+            cutoffs[company_id] = now - timedelta(days=days)
+    return cutoffs, keeps_forever
+
+def partition_horizon(cutoffs, keeps_forever):
+    """Time before which every policy has expired all rows (partitions can go)"""
+    if keeps_forever or not cutoffs:
+        return None
+    return min(cutoffs.values())
+
+def delete_expired_rows(cutoffs, chunk_size):
+    """Delete expired rows in chunks of at most `chunk_size`; returns rows deleted"""
+    deleted = 0
+    for company_id, cutoff in cutoffs.items():
+        expired = AuditLog.objects.filter(company_id=company_id, timestamp__lt=cutoff)
+        while True:
+            ids = list(expired.order_by('timestamp', 'id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Bounded by the retention cutoff too, so partitions outside it are pruned
+                count, _ = AuditLog.objects.filter(id__in=ids, timestamp__lt=cutoff).delete()
+            deleted += count
+    return deleted
@@ -0,0 +1,67 @@
+from collections import Counter
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .filters import start_of_day
+from .models import AuditActivityRollup, AuditLog
+
+def bucket_counts(records):
+    """Counter of (company_id, day, action, resource_type) for audit records"""
+    return Counter(
+        (record.company_id, timezone.localdate(record.timestamp), record.action, record.resource_type)
+        for record in records
+    )
+
+def apply_counts(counts):
+    """Add counts to their rollup buckets, creating missing buckets"""
+    for (company_id, day, action, resource_type), count in counts.items():
+        bucket = AuditActivityRollup.objects.filter(
+            company_id=company_id, day=day, action=action, resource_type=resource_type,
+        )
+        if bucket.update(count=F('count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                AuditActivityRollup.objects.create(
+                    company_id=company_id, day=day, action=action, resource_type=resource_type, count=count,
+                )
+        except IntegrityError:
+            # Another writer created the bucket first
+            if not bucket.update(count=F('count') + count):
+                raise
+
+def record_activity(records):
+    apply_counts(bucket_counts(records))
+
+def rebuild_rollups(since=None):
+    """
+    Recompute rollups from the raw audit rows, from `since` (a date) onwards
+    or entirely. Returns the number of buckets written.
+    """
+    logs = AuditLog.objects.all()
+    buckets = AuditActivityRollup.objects.all()
+    if since is not None:
+        logs = logs.filter(timestamp__gte=start_of_day(since))
+        buckets = buckets.filter(day__gte=since)
+
+    rows = (
+        logs.order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('company_id', 'day', 'action', 'resource_type')
+        .annotate(total=Count('id'))
+    )
+    with transaction.atomic():
+        buckets.delete()
+        created = AuditActivityRollup.objects.bulk_create(
+            (AuditActivityRollup(company_id=row['company_id'], day=row['day'], action=row['action'],
+                                 resource_type=row['resource_type'], count=row['total'])
+             for row in rows.iterator()),
+            batch_size=1000,
+        )
+    return len(created)
+
+def default_window(days=30):
+    today = timezone.localdate()
+    return today - timedelta(days=days - 1), today
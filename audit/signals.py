@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from companies.models import User
+from .models import AuditLog
+from .utils import USER_SEARCH_FIELDS, user_search_text
+
+@receiver(post_save, sender=User)
+def refresh_user_search(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the denormalized search text of a renamed user's audit rows current"""
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(USER_SEARCH_FIELDS):
+        return
+    search = user_search_text(instance)
+    rows = AuditLog.objects.filter(user=instance)
+    # Rows are rewritten together, so the newest one tells us whether the
+    # searchable fields changed (an index seek instead of a scan per save)
+    latest = rows.order_by('-timestamp', '-id').values_list('user_search', flat=True).first()
+    if latest is not None and latest != search:
+        rows.exclude(user_search=search).update(user_search=search)
@@ -1 +1,490 @@
-from django.test import TestCase
\ No newline at end of file
+import csv
+import io
+import json
+import threading
+import tracemalloc
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from rest_framework.test import APIClient
+from accounts.tokens import PermissionRefreshToken
+from companies.models import Company, User
+from erp.testing import QueryCountMixin
+from roles.models import Permission, Role, UserRole
+from . import partitions
+from .exports import EXPORT_CHUNK_SIZE, export_rows
+from .filters import AuditLogFilter
+from .models import AuditActivityRollup, AuditLog
+from .rollups import apply_counts, rebuild_rollups
+from .utils import build_record, log_action
+from .writer import AuditWriter, write_records
+
+class AuditLogListQueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.auditor = User.objects.create_user(username='auditor', email='auditor@acme.com', company=self.company)
+        role = Role.objects.create(name='Auditor')
+        role.permissions.add(Permission.objects.create(name='VIEW_AUDIT_LOGS'))
+        UserRole.objects.create(user=self.auditor, role=role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.auditor)
+
+    def add_logs(self, count):
+        users = [
+            User.objects.create_user(username=f'actor{AuditLog.objects.count()}-{i}', company=self.company)
+            for i in range(3)
+        ]
+        AuditLog.objects.bulk_create(
+            AuditLog(user=users[i % 3], company=self.company, action='UPDATE', resource_type='User')
+            for i in range(count)
+        )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_logs(3)
+        # audit rows joined with their users
+        self.assertListingQueriesConstant('/api/audit-logs/', lambda: self.add_logs(30), 1)
+
+class AuditLogKeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.other_company = Company.objects.create(name='Globex')
+        self.auditor = User.objects.create_user(username='auditor', email='auditor@acme.com', company=self.company)
+        role = Role.objects.create(name='Auditor')
+        role.permissions.add(Permission.objects.create(name='VIEW_AUDIT_LOGS'))
+        UserRole.objects.create(user=self.auditor, role=role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.auditor)
+
+        AuditLog.objects.bulk_create(
+            AuditLog(user=self.auditor, company=self.company, action='LOGIN' if i % 2 else 'UPDATE', resource_type='User')
+            for i in range(23)
+        )
+        AuditLog.objects.bulk_create(
+            AuditLog(company=self.other_company, action='LOGIN', resource_type='User') for _ in range(5)
+        )
+        # Force timestamp ties so the id tie-breaker matters
+        ids = list(AuditLog.objects.filter(company=self.company).order_by('id').values_list('id', flat=True))
+        AuditLog.objects.filter(id__in=ids[5:15]).update(timestamp=AuditLog.objects.get(id=ids[5]).timestamp)
+
+    def walk(self, url, direction='next'):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [row['id'] for row in response.data['results']]
+            seen.extend(page if direction == 'next' else reversed(page))
+            url = response.data[direction]
+        return seen, response
+
+    def expected_ids(self, **filters):
+        return list(
+            AuditLog.objects.filter(company=self.company, **filters)
+            .order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+
+    def test_forward_pages_cover_every_row_once(self):
+        seen, last = self.walk('/api/audit-logs/?page_size=5')
+        self.assertEqual(seen, self.expected_ids())
+        self.assertIsNotNone(last.data['previous'])
+        self.assertNotIn('count', last.data)
+
+    def test_backward_pages_retrace_forward_pages(self):
+        _, last = self.walk('/api/audit-logs/?page_size=4')
+        first_of_last_page = last.data['results'][0]['id']
+        seen, first = self.walk(last.data['previous'], direction='previous')
+        expected = self.expected_ids()
+        self.assertEqual(list(reversed(seen)), expected[:expected.index(first_of_last_page)])
+        self.assertIsNone(first.data['previous'])
+
+    def test_ascending_ordering_and_filters_are_honoured(self):
+        seen, _ = self.walk('/api/audit-logs/?page_size=3&ordering=timestamp&action=login')
+        self.assertEqual(seen, list(reversed(self.expected_ids(action='LOGIN'))))
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/audit-logs/?cursor=garbage').status_code, 404)
+
+class AuditWriterTests(TestCase):
+    def setUp(self):
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def sink(self, records):
+        self.batches.append(list(records))
+        self.flushed.set()
+        return len(records)
+
+    def record(self, n=0):
+        return build_record(None, None, 'LOGIN', 'User', str(n), 'test')
+
+    @override_settings(AUDIT_WRITE_MODE='async')
+    def test_records_are_flushed_in_batches(self):
+        writer = AuditWriter(batch_size=10, flush_interval=60, sink=self.sink)
+        writer.stopping.set()  # keep the background thread from racing the test
+        writer._ensure_started = lambda: None
+        for i in range(25):
+            writer.write(self.record(i))
+        self.assertEqual(writer.stats()['queue_depth'], 25)
+
+        writer.shutdown()
+        self.assertEqual([len(batch) for batch in self.batches], [10, 10, 5])
+        stats = writer.stats()
+        self.assertEqual((stats['enqueued'], stats['written'], stats['flushes'], stats['queue_depth']), (25, 25, 3, 0))
+        self.assertEqual(stats['max_flush_size'], 10)
+
+    @override_settings(AUDIT_WRITE_MODE='async')
+    def test_background_thread_flushes_after_interval(self):
+        writer = AuditWriter(batch_size=100, flush_interval=0.05, sink=self.sink)
+        writer.write(self.record())
+        self.assertTrue(self.flushed.wait(5))
+        writer.shutdown()
+        self.assertEqual(sum(len(batch) for batch in self.batches), 1)
+
+    @override_settings(AUDIT_WRITE_MODE='async')
+    def test_full_buffer_drops_and_counts(self):
+        writer = AuditWriter(batch_size=10, flush_interval=60, max_queue=2, sink=self.sink)
+        writer._ensure_started = lambda: None
+        with self.assertLogs('audit.writer', 'WARNING'):
+            for i in range(5):
+                writer.write(self.record(i))
+        self.assertEqual(writer.stats()['dropped'], 3)
+        writer.flush()
+        self.assertEqual(writer.stats()['written'], 2)
+
+    def test_sync_mode_writes_inline(self):
+        company = Company.objects.create(name='Acme')
+        user = User.objects.create_user(username='alice', company=company)
+        log_action(user, 'UPDATE', 'User', str(user.id), 'Updated user')
+        log = AuditLog.objects.get()
+        self.assertEqual((log.user_id, log.company_id, log.ip_address), (user.id, company.id, '127.0.0.1'))
+
+class AuditWriterIntegrityTests(TransactionTestCase):
+    def test_dangling_references_are_salvaged(self):
+        user = User.objects.create_user(username='ghost')
+        record = build_record(user.id, None, 'DELETE', 'User', str(user.id), 'gone')
+        user.delete()
+        self.assertEqual(write_records([record]), 1)
+        self.assertIsNone(AuditLog.objects.get().user_id)
+
+class AuditLogExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        other = Company.objects.create(name='Globex')
+        self.auditor = User.objects.create_user(username='auditor', email='auditor@acme.com', company=self.company)
+        role = Role.objects.create(name='Auditor')
+        role.permissions.add(Permission.objects.create(name='VIEW_AUDIT_LOGS'))
+        UserRole.objects.create(user=self.auditor, role=role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.auditor)
+
+        AuditLog.objects.bulk_create([
+            AuditLog(user=self.auditor, company=self.company, action='LOGIN', resource_type='User', details='in'),
+            AuditLog(company=self.company, action='DELETE', resource_type='Role', details='a, "quoted" value'),
+            AuditLog(company=other, action='LOGIN', resource_type='User', details='other tenant'),
+        ])
+
+    def test_csv_export_is_streamed_and_scoped(self):
+        response = self.client.get('/api/audit-logs/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['details'] for row in rows], ['a, "quoted" value', 'in'])
+        self.assertEqual(rows[0]['user_name'], 'System')
+        self.assertEqual(rows[1]['user_email'], 'auditor@acme.com')
+
+    def test_ndjson_export_honours_filters(self):
+        response = self.client.get('/api/audit-logs/export/?export_format=ndjson&action=login')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['details'] for line in lines], ['in'])
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get('/api/audit-logs/export/?export_format=xml').status_code, 400)
+
+    def peak_export_memory(self, rows):
+        AuditLog.objects.bulk_create(
+            (AuditLog(company=self.company, action='UPDATE', resource_type='User', details='x' * 200) for _ in range(rows)),
+            batch_size=1000,
+        )
+        response = self.client.get('/api/audit-logs/export/?export_format=ndjson')
+        tracemalloc.start()
+        try:
+            for _ in response.streaming_content:
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    async def test_asgi_export_is_streamed_in_chunks(self):
+        def add_rows():
+            AuditLog.objects.bulk_create(
+                AuditLog(company=self.company, action='UPDATE', resource_type='User', details='x') for _ in range(5000)
+            )
+            return str(PermissionRefreshToken.for_user(self.auditor).access_token)
+
+        access = await sync_to_async(add_rows)()
+        produced = []
+
+        def counting_rows(queryset):
+            for row in export_rows(queryset):
+                produced.append(row['id'])
+                yield row
+
+        with mock.patch('audit.views.export_rows', counting_rows):
+            response = await AsyncClient().get(
+                '/api/audit-logs/export/?export_format=ndjson', headers={'Authorization': f'Bearer {access}'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            # Only the first batch has been read from the database
+            self.assertEqual(len(produced), EXPORT_CHUNK_SIZE)
+            rest = [chunk async for chunk in chunks]
+
+        lines = b''.join([first] + rest).decode().splitlines()
+        self.assertEqual(len(lines), len(produced))
+        self.assertEqual(len(lines), 5002)
+
+    def test_export_memory_does_not_grow_with_rows(self):
+        # Full-size (1M row) run: python -m benchmarks.audit_export
+        small = self.peak_export_memory(3000)
+        large = self.peak_export_memory(12000)
+        self.assertLess(large, small * 1.5)
+        self.assertLess(large, 8 * 1024 * 1024)
+
+class AuditLogQueryPlanTests(TestCase):
+    """
+    EXPLAIN the canonical audit queries and fail if any of them falls back to
+    a sequential scan or sorts rows instead of reading them in index order.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme')
+        cls.user = User.objects.create_user(username='alice', company=cls.company)
+        AuditLog.objects.bulk_create(
+            AuditLog(user=cls.user if i % 2 else None, company=cls.company, action=['LOGIN', 'UPDATE', 'DELETE'][i % 3], resource_type='User')
+            for i in range(300)
+        )
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny tables would make the planner prefer a seq scan anyway
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def filtered(self, data, queryset=None):
+        if queryset is None:
+            queryset = AuditLog.objects.filter(company=self.company)
+        return AuditLogFilter(data, queryset=queryset).qs.order_by('-timestamp', '-id')[:51]
+
+    def canonical_queries(self):
+        cursor_time = timezone.now()
+        return {
+            'tenant listing': self.filtered({}),
+            'tenant listing by action': self.filtered({'action': 'login'}),
+            'tenant listing by date range': self.filtered({'start_date': '2024-01-01', 'end_date': '2024-02-01'}),
+            'tenant listing by action and date': self.filtered({'action': 'delete', 'start_date': '2024-01-01'}),
+            'tenant keyset page': AuditLog.objects.filter(company=self.company).filter(
+                Q(timestamp__lt=cursor_time) | Q(timestamp=cursor_time, id__lt=100)
+            ).order_by('-timestamp', '-id')[:51],
+            'tenant ascending listing': AuditLog.objects.filter(company=self.company).order_by('timestamp', 'id')[:51],
+            'superuser listing': self.filtered({}, AuditLog.objects.all()),
+            'user history': AuditLog.objects.filter(user=self.user).order_by('-timestamp', '-id')[:51],
+        }
+
+    def assert_plan_uses_indexes(self, label, plan):
+        if connection.vendor == 'sqlite':
+            for line in plan.splitlines():
+                self.assertFalse('SCAN' in line and 'INDEX' not in line, f'{label}: sequential scan\n{plan}')
+                self.assertNotIn('TEMP B-TREE', line, f'{label}: filesort\n{plan}')
+        elif connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, f'{label}: sequential scan\n{plan}')
+            self.assertNotRegex(plan, r'\bSort\b', f'{label}: explicit sort\n{plan}')
+        elif connection.vendor == 'mysql':
+            self.assertNotIn('Using filesort', plan, f'{label}: filesort\n{plan}')
+
+    def test_canonical_queries_use_indexes(self):
+        for label, queryset in self.canonical_queries().items():
+            with self.subTest(label):
+                self.assert_plan_uses_indexes(label, queryset.explain())
+
+class AuditLogUserFilterTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.alice = User.objects.create_user(username='alice', email='alice@acme.com', first_name='Alice', last_name='Liddell', company=self.company)
+        self.bob = User.objects.create_user(username='bob', email='bob@acme.com', company=self.company)
+        for user in (self.alice, self.bob):
+            log_action(user, 'LOGIN', 'User', str(user.id), 'Successful login')
+        log_action(None, 'LOGIN', 'User', 'unknown', 'Unknown user')
+
+    def matches(self, value):
+        queryset = AuditLogFilter({'user': value}, queryset=AuditLog.objects.all()).qs
+        return sorted(log.user.username for log in queryset)
+
+    def test_matches_any_user_field_case_insensitively(self):
+        self.assertEqual(self.matches('ALICE'), ['alice'])
+        self.assertEqual(self.matches('liddell'), ['alice'])
+        self.assertEqual(self.matches('@acme.com'), ['alice', 'bob'])
+        self.assertEqual(self.matches('carol'), [])
+
+    def test_filter_does_not_join_users(self):
+        queryset = AuditLogFilter({'user': 'alice'}, queryset=AuditLog.objects.all()).qs
+        self.assertNotIn('companies_user', str(queryset.query))
+
+    def test_renamed_user_stays_searchable(self):
+        self.bob.last_name = 'Builder'
+        self.bob.save()
+        self.assertEqual(self.matches('builder'), ['bob'])
+
+class AuditLogDateFilterTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for days in (0, 1, 3):
+            log = AuditLog.objects.create(action='LOGIN', resource_type='User', resource_id=str(days), details='')
+            AuditLog.objects.filter(pk=log.pk).update(timestamp=now - timedelta(days=days))
+        self.today = timezone.localdate(now)
+
+    def filter(self, **params):
+        return AuditLogFilter(params, queryset=AuditLog.objects.all()).qs
+
+    def test_end_date_includes_whole_day(self):
+        self.assertEqual(self.filter(end_date=self.today).count(), 3)
+        self.assertEqual(self.filter(start_date=self.today, end_date=self.today).count(), 1)
+        self.assertEqual(self.filter(start_date=self.today - timedelta(days=1)).count(), 2)
+
+    def test_date_bounds_compare_timestamp_directly(self):
+        sql = str(self.filter(start_date=date(2024, 1, 1), end_date=date(2024, 1, 31)).query)
+        self.assertNotIn('CAST', sql.upper())
+        self.assertNotIn('django_datetime', sql)
+
+@override_settings(AUDIT_RETENTION_DAYS=30)
+class AuditLogRetentionTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme')
+        self.strict = Company.objects.create(name='Strict', audit_retention_days=7)
+        self.forever = Company.objects.create(name='Forever')
+        now = timezone.now()
+        for company in (self.company, self.strict, None):
+            for days in (1, 10, 40):
+                self.add_log(company, now - timedelta(days=days))
+
+    def add_log(self, company, timestamp):
+        log = AuditLog.objects.create(company=company, action='LOGIN', resource_type='User', resource_id='1', details='')
+        AuditLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+
+    def remaining(self, company):
+        return AuditLog.objects.filter(company=company).count()
+
+    def test_rows_past_retention_are_deleted_in_chunks(self):
+        out = io.StringIO()
+        call_command('maintain_audit_logs', chunk_size=1, stdout=out)
+
+        self.assertEqual(self.remaining(self.company), 2)
+        self.assertEqual(self.remaining(self.strict), 1)
+        self.assertEqual(self.remaining(None), 2)
+        self.assertIn('Deleted 4 expired audit log rows', out.getvalue())
+
+    @override_settings(AUDIT_RETENTION_DAYS=None)
+    def test_without_default_only_company_policies_apply(self):
+        call_command('maintain_audit_logs', stdout=io.StringIO())
+        self.assertEqual(self.remaining(self.company), 3)
+        self.assertEqual(self.remaining(None), 3)
+        self.assertEqual(self.remaining(self.strict), 1)
+
+@skipUnless(connection.vendor == 'postgresql', 'Audit partitioning is PostgreSQL only')
+class AuditLogPartitioningTests(TestCase):
+    def add_log(self, timestamp):
+        log = AuditLog.objects.create(action='LOGIN', resource_type='User', resource_id='1', details='')
+        AuditLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+
+    def test_conversion_keeps_current_month_rows_in_legacy_partition(self):
+        now = timezone.now()
+        current = partitions.month_start(now)
+        self.add_log(now - timedelta(days=70))
+        self.add_log(now)
+
+        partitions.convert_to_partitioned()
+        self.assertTrue(partitions.is_partitioned())
+        legacy = [p for p in partitions.list_partitions() if p[0] == partitions.LEGACY_TABLE]
+        self.assertEqual(legacy, [(partitions.LEGACY_TABLE, None, partitions.add_months(current, 1))])
+
+        # The current month is already covered by the legacy partition
+        created = partitions.ensure_partitions(2)
+        self.assertEqual(created, [
+            partitions.partition_name(partitions.add_months(current, 1)),
+            partitions.partition_name(partitions.add_months(current, 2)),
+        ])
+        self.add_log(partitions.add_months(current, 1))
+        self.assertEqual(AuditLog.objects.count(), 3)
+
+class AuditActivityStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.other = Company.objects.create(name='Other')
+        self.auditor = User.objects.create_user(username='auditor', email='auditor@acme.com', company=self.company)
+        self.outsider = User.objects.create_user(username='outsider', email='outsider@other.com', company=self.other)
+        role = Role.objects.create(name='Auditor')
+        role.permissions.add(Permission.objects.create(name='VIEW_AUDIT_LOGS'))
+        UserRole.objects.create(user=self.auditor, role=role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.auditor)
+
+        for _ in range(3):
+            log_action(self.auditor, 'LOGIN', 'User', str(self.auditor.id), 'Successful login')
+        log_action(self.auditor, 'CREATE', 'User', '1', 'Created user')
+        log_action(self.outsider, 'DELETE', 'User', '2', 'Deleted user')
+
+    def stats(self, **params):
+        response = self.client.get('/api/audit-stats/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_writes_maintain_daily_buckets(self):
+        today = timezone.localdate()
+        buckets = AuditActivityRollup.objects.filter(company=self.company).values_list('day', 'action', 'count')
+        self.assertEqual(sorted(buckets), [(today, 'CREATE', 1), (today, 'LOGIN', 3)])
+
+    def test_stats_are_scoped_to_company(self):
+        data = self.stats()
+        self.assertEqual(data['totals'], {'CREATE': 1, 'LOGIN': 3})
+        self.assertEqual(self.stats(action='login,delete')['totals'], {'LOGIN': 3})
+
+    def test_stats_respect_window(self):
+        today = timezone.localdate()
+        AuditActivityRollup.objects.create(company=self.company, day=today - timedelta(days=45), action='LOGIN', resource_type='User', count=7)
+
+        self.assertEqual(self.stats()['totals']['LOGIN'], 3)
+        self.assertEqual(self.stats(start_date=today - timedelta(days=60))['totals']['LOGIN'], 10)
+
+    def test_buckets_are_unique_and_counts_add_once(self):
+        today = timezone.localdate()
+        for company in (self.company, None):
+            bucket = {'company': company, 'day': today, 'action': 'UPDATE', 'resource_type': 'Role'}
+            AuditActivityRollup.objects.create(count=2, **bucket)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                AuditActivityRollup.objects.create(count=1, **bucket)
+
+            apply_counts({(company.pk if company else None, today, 'UPDATE', 'Role'): 1})
+            self.assertEqual(AuditActivityRollup.objects.get(**bucket).count, 3)
+
+    def test_stats_require_permission(self):
+        self.client.force_authenticate(self.outsider)
+        self.assertEqual(self.client.get('/api/audit-stats/').status_code, 403)
+
+    def test_rebuild_matches_write_path(self):
+        expected = sorted(AuditActivityRollup.objects.values_list('company_id', 'day', 'action', 'resource_type', 'count'))
+        AuditActivityRollup.objects.all().delete()
+        rebuild_rollups()
+        self.assertEqual(sorted(AuditActivityRollup.objects.values_list('company_id', 'day', 'action', 'resource_type', 'count')), expected)
@@ -4,6 +4,7 @@ from . import views
 
 router = DefaultRouter()
 router.register(r'audit-logs', views.AuditLogViewSet, basename='auditlog')
+router.register(r'audit-stats', views.AuditActivityStatsViewSet, basename='auditstats')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,4 +1,5 @@
-from .models import AuditLog
+from django.utils import timezone
+from .writer import AuditRecord, audit_writer
 
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -8,7 +9,16 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
-def log_action(user, action, resource_type, resource_id, details, request=None):
+# User fields matched by the audit log "user" filter
+USER_SEARCH_FIELDS = ['username', 'email', 'first_name', 'last_name']
+
+def user_search_text(user):
+    """Normalized search text stored on audit rows written for this user"""
+    if not user:
+        return ''
+    return ' '.join(value for value in (getattr(user, field) for field in USER_SEARCH_FIELDS) if value).lower()
+
+def build_record(user_id, company_id, action, resource_type, resource_id, details, request=None, user_search=''):
     ip_address = None
     user_agent = None
     
@@ -16,21 +26,40 @@ def log_action(user, action, resource_type, resource_id, details, request=None):
         ip_address = get_client_ip(request)
         user_agent = request.META.get('HTTP_USER_AGENT', '')
     
-    if not user:
-        return
-    
-    # For superusers, use None for company (system-level actions)
-    company = None
-    if hasattr(user, 'company') and user.company:
-        company = user.company
-    
-    AuditLog.objects.create(
-        user=user,
-        company=company,
+    return AuditRecord(
+        user_id=user_id,
+        company_id=company_id,
         action=action,
         resource_type=resource_type,
         resource_id=resource_id,
         details=details,
         ip_address=ip_address or '127.0.0.1',
-        user_agent=user_agent or 'unknown'
-    )
\ No newline at end of file
+        user_agent=user_agent or 'unknown',
+        timestamp=timezone.now(),
+        user_search=user_search,
+    )
+
+def log_action(user, action, resource_type, resource_id, details, request=None):
+    if not user:
+        return
+    
+    # For superusers, company_id is None (system-level actions)
+    audit_writer.write(build_record(
+        user.pk, user.company_id, action, resource_type, resource_id, details, request,
+        user_search=user_search_text(user),
+    ))
+
+def log_actions(user, entries, request=None):
+    """Record several (action, resource_type, resource_id, details) entries by one actor at once"""
+    if not user:
+        return
+    
+    user_search = user_search_text(user)
+    audit_writer.write_many([
+        build_record(user.pk, user.company_id, action, resource_type, resource_id, details, request, user_search=user_search)
+        for action, resource_type, resource_id, details in entries
+    ])
+
+def log_anonymous_action(action, resource_type, resource_id, details, request=None):
+    """Record an event that has no authenticated actor (e.g. unknown login email)"""
+    audit_writer.write(build_record(None, None, action, resource_type, resource_id, details, request))
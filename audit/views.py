@@ -1,9 +1,18 @@
-from rest_framework import viewsets, permissions
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from .models import AuditLog
+from .models import AuditActivityRollup, AuditLog
 from .serializers import AuditLogSerializer
-from .filters import AuditLogFilter
+from .filters import AuditActivityRollupFilter, AuditLogFilter
+from .exports import EXPORT_FORMATS, export_rows, stream_async
+from .pagination import KeysetPagination
+from .rollups import default_window
 from companies.permissions import HasPermission
 from companies.mixins import CompanyIsolationMixin
 
@@ -12,13 +21,72 @@ class AuditLogViewSet(CompanyIsolationMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated, HasPermission('VIEW_AUDIT_LOGS')]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = AuditLogFilter
+    pagination_class = KeysetPagination
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
     
     def get_queryset(self):
-        if self.request.user.is_superuser:
-            return AuditLog.objects.all()
-        elif hasattr(self.request.user, 'company') and self.request.user.company:
-            return AuditLog.objects.filter(company=self.request.user.company)
-        else:
-            return AuditLog.objects.none()
\ No newline at end of file
+        # AuditLogSerializer reads user.username/email for every row
+        return self.request_context.scope(AuditLog.objects.select_related('user'))
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered audit log as CSV (default) or NDJSON (?export_format=ndjson)"""
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f'Unsupported export format: {export_format}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stream, content_type, extension = EXPORT_FORMATS[export_format]
+        queryset = self.filter_queryset(self.get_queryset())
+        
+        content = stream(export_rows(queryset))
+        if isinstance(request._request, ASGIRequest):
+            content = stream_async(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f'audit-logs-{timezone.now():%Y%m%d-%H%M%S}.{extension}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class AuditActivityStatsViewSet(CompanyIsolationMixin, viewsets.GenericViewSet):
+    """
+    Daily audit activity counts for dashboards, read from the precomputed
+    rollups. Defaults to the last 30 days; narrow with start_date, end_date,
+    action (comma-separated) and resource_type.
+    """
+    queryset = AuditActivityRollup.objects.all()
+    permission_classes = [permissions.IsAuthenticated, HasPermission('VIEW_AUDIT_LOGS')]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AuditActivityRollupFilter
+    pagination_class = None
+    
+    def list(self, request):
+        start_date, end_date = default_window()
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'start_date' not in request.query_params:
+            queryset = queryset.filter(day__gte=start_date)
+        if 'end_date' not in request.query_params:
+            queryset = queryset.filter(day__lte=end_date)
+        
+        # Superusers without a company filter see every tenant summed together
+        rows = (
+            queryset.order_by('day', 'action', 'resource_type')
+            .values('day', 'action', 'resource_type')
+            .annotate(total=Sum('count'))
+        )
+        results = []
+        totals = {}
+        for row in rows:
+            results.append({
+                'day': row['day'],
+                'action': row['action'],
+                'resource_type': row['resource_type'],
+                'count': row['total'],
+            })
+            totals[row['action']] = totals.get(row['action'], 0) + row['total']
+        
+        return Response({
+            'start_date': request.query_params.get('start_date', start_date),
+            'end_date': request.query_params.get('end_date', end_date),
+            'totals': totals,
+            'results': results,
+        })
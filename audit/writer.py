@@ -0,0 +1,179 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Immutable snapshot of an audit event, safe to hand to another thread
+AuditRecord = namedtuple('AuditRecord', [
+    'user_id', 'company_id', 'action', 'resource_type', 'resource_id',
+    'details', 'ip_address', 'user_agent', 'timestamp', 'user_search',
+])
+
+def write_records(records):
+    """
+    Persist records with a single bulk insert, salvaging rows on FK errors.
+    Activity rollups are updated in the same transaction as the rows.
+    """
+    from .models import AuditLog
+    from .rollups import record_activity
+
+    rows = [AuditLog(**record._asdict()) for record in records]
+    try:
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(rows)
+            record_activity(records)
+        return len(rows)
+    except IntegrityError:
+        pass
+
+    # A user or company was deleted before the batch was flushed; keep the
+    # event but drop the dangling reference
+    written = 0
+    for record in records:
+        for values in (record._asdict(), dict(record._asdict(), user_id=None, company_id=None)):
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.create(**values)
+                    record_activity([AuditRecord(**values)])
+                written += 1
+                break
+            except IntegrityError:
+                continue
+        else:
+            logger.error('Dropping unwritable audit record: %r', record)
+    return written
+
+class AuditWriter:
+    """
+    Write-behind buffer for audit records.
+
+    write() enqueues a record and returns immediately; a daemon thread flushes
+    the buffer with one bulk insert every `batch_size` records or
+    `flush_interval` seconds, whichever comes first. The buffer is drained at
+    interpreter exit. In 'sync' mode records are written inline instead.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.5, max_queue=10000, sink=write_records):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_size': 0,
+            'max_flush_size': 0,
+        }
+
+    def write(self, record):
+        if settings.AUDIT_WRITE_MODE == 'sync':
+            self._flush_batch([record])
+            return
+
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count(dropped=1)
+            logger.warning('Audit buffer full, dropping record: %r', record)
+            return
+        self._count(enqueued=1)
+
+    def write_many(self, records):
+        """Enqueue several records; in 'sync' mode they go out as one bulk insert"""
+        if settings.AUDIT_WRITE_MODE == 'sync':
+            if records:
+                self._flush_batch(list(records))
+            return
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Synchronously write everything currently buffered"""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self._flush_batch(batch)
+
+    def shutdown(self, timeout=5):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self.queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            batch = self._take(block=True)
+            if batch:
+                close_old_connections()
+                self._flush_batch(batch)
+        close_old_connections()
+
+    def _take(self, block):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if block:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush_batch(self, batch):
+        with self.flush_lock:
+            try:
+                written = self.sink(batch)
+            except Exception:
+                logger.exception('Failed to write %d audit records', len(batch))
+                written = 0
+        self._count(written=written, failed=len(batch) - written, flushes=1)
+        with self.lock:
+            self.counters['last_flush_size'] = len(batch)
+            self.counters['max_flush_size'] = max(self.counters['max_flush_size'], len(batch))
+
+    def _count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+audit_writer = AuditWriter(
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_MS / 1000,
+    max_queue=settings.AUDIT_MAX_QUEUE,
+)
+atexit.register(audit_writer.shutdown)
@@ -0,0 +1,80 @@
+"""
+Export a large synthetic audit log through the streaming export endpoint and
+check that resident memory stays under a fixed ceiling.
+
+    python -m benchmarks.audit_export [--rows 1000000] [--max-rss-mb 64]
+
+Exits with status 1 if RSS grows by more than --max-rss-mb while streaming.
+"""
+import argparse
+import os
+import sys
+import time
+from .base import setup_django
+
+def current_rss_mb():
+    # Linux only: resident pages * page size
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--max-rss-mb', type=float, default=64)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import transaction
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from audit.models import AuditLog
+    from companies.models import Company, User
+
+    company = Company.objects.create(name='Bench')
+    user = User.objects.create_superuser(username='bench', email='bench@example.com', password=None)
+    actors = [User.objects.create_user(username=f'actor{i}', email=f'actor{i}@example.com', company=company) for i in range(50)]
+
+    print(f'seeding {args.rows:,} audit rows...')
+    now = timezone.now()
+    batch = 10_000
+    for start in range(0, args.rows, batch):
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(
+                AuditLog(
+                    user=actors[i % len(actors)], company=company, action='UPDATE',
+                    resource_type='User', resource_id=str(i), details=f'Synthetic event {i}',
+                    ip_address='10.0.0.1', user_agent='bench', timestamp=now,
+                )
+                for i in range(start, min(start + batch, args.rows))
+            )
+
+    client = APIClient()
+    client.force_authenticate(user)
+    response = client.get(f'/api/audit-logs/export/?export_format={args.format}')
+
+    baseline = peak = current_rss_mb()
+    exported_bytes = lines = 0
+    started = time.perf_counter()
+    for chunk in response.streaming_content:
+        exported_bytes += len(chunk)
+        lines += 1
+        if lines % 10_000 == 0:
+            peak = max(peak, current_rss_mb())
+    elapsed = time.perf_counter() - started
+    peak = max(peak, current_rss_mb())
+
+    growth = peak - baseline
+    print(f'exported {lines:,} lines ({exported_bytes / 1e6:,.1f} MB) in {elapsed:.1f}s '
+          f'({lines / elapsed:,.0f} rows/s)')
+    print(f'RSS baseline {baseline:.1f} MB, peak {peak:.1f} MB, growth {growth:.1f} MB '
+          f'(ceiling {args.max_rss_mb:.0f} MB)')
+
+    if growth > args.max_rss_mb:
+        print('FAIL: memory grew beyond the ceiling')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
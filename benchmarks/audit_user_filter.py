@@ -0,0 +1,65 @@
+"""
+Compare the audit log "user" filter: the original four-way icontains join
+against companies.User versus the denormalized user_search column.
+
+    python -m benchmarks.audit_user_filter [--rows 200000] [--users 2000]
+
+On PostgreSQL the new path is served by a pg_trgm GIN index; on the SQLite
+database used here it is a join-free scan, which bounds the comparison.
+"""
+import argparse
+from .base import measure, report, setup_django
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import transaction
+    from django.db.models import Q
+    from audit.filters import AuditLogFilter
+    from audit.models import AuditLog
+    from audit.utils import user_search_text
+    from companies.models import Company, User
+
+    company = Company.objects.create(name='Bench')
+    users = User.objects.bulk_create(
+        User(username=f'user{i:05d}', email=f'person{i:05d}@example.com', first_name=f'First{i}', last_name=f'Last{i}', company=company)
+        for i in range(args.users)
+    )
+    search = {user.id: user_search_text(user) for user in users}
+
+    batch = 10_000
+    for start in range(0, args.rows, batch):
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(
+                AuditLog(user=users[i % len(users)], company=company, action='UPDATE', resource_type='User',
+                         user_search=search[users[i % len(users)].id])
+                for i in range(start, min(start + batch, args.rows))
+            )
+
+    base = AuditLog.objects.filter(company=company).order_by('-timestamp', '-id')
+    value = 'PERSON00042'
+
+    def legacy():
+        return list(base.filter(
+            Q(user__username__icontains=value) |
+            Q(user__email__icontains=value) |
+            Q(user__first_name__icontains=value) |
+            Q(user__last_name__icontains=value)
+        )[:50])
+
+    def current():
+        return list(AuditLogFilter({'user': value}, queryset=base).qs[:50])
+
+    assert [log.id for log in legacy()] == [log.id for log in current()]
+    print(f'{args.rows:,} audit rows, {args.users:,} users, searching {value!r}\n')
+    report('legacy icontains join', *measure(legacy, args.iterations))
+    report('denormalized user_search', *measure(current, args.iterations))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Shared setup for the standalone benchmarks in this package.
+
+Each benchmark runs against a throwaway SQLite database so it can never touch
+the configured development or production database. Run them from the
+project root, e.g. ``python -m benchmarks.permission_check``.
+"""
+import atexit
+import os
+import statistics
+import tempfile
+import time
+
+def setup_django():
+    fd, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    atexit.register(os.remove, path)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'erp.settings')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+def measure(func, iterations):
+    """Run func `iterations` times and return (ops/sec, per-call seconds list)"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return iterations / sum(timings), timings
+
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(label, ops_per_sec, timings):
+    print(
+        f'{label:<40} {ops_per_sec:>12,.0f} ops/s  '
+        f'p50 {statistics.median(timings) * 1e6:>9.1f}us  '
+        f'p99 {percentile(timings, 99) * 1e6:>9.1f}us'
+    )
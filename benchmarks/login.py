@@ -0,0 +1,92 @@
+"""
+Compare logins per second on one worker: the original login sequence
+(email lookup, authenticate() re-fetching by username, two full saves, two
+audit rows, permissions resolved twice) against the current login view.
+
+    python -m benchmarks.login [--iterations N] [--hasher md5|pbkdf2]
+
+Password hashing dominates with the production PBKDF2 hasher, so the default
+uses MD5 to expose the database work around it; pass --hasher pbkdf2 for
+end-to-end numbers.
+"""
+import argparse
+from .base import measure, report, setup_django
+
+HASHERS = {
+    'md5': 'django.contrib.auth.hashers.MD5PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+
+def legacy_login(request, email, password):
+    # The login path before it was made single-write
+    from django.contrib.auth import authenticate
+    from accounts.serializers import UserSerializer
+    from accounts.tokens import PermissionRefreshToken
+    from audit.utils import log_action
+    from companies.models import User
+    from roles.utils import get_effective_permissions
+
+    user = User.objects.get(email=email)
+    authenticated_user = authenticate(username=user.username, password=password)
+    if authenticated_user.failed_login_attempts > 0:
+        authenticated_user.failed_login_attempts = 0
+        authenticated_user.save()
+    log_action(authenticated_user, 'LOGIN', 'User', str(authenticated_user.id), 'Successful login', request)
+
+    authenticated_user.failed_login_attempts = 0
+    authenticated_user.locked_until = None
+    authenticated_user.save()
+    refresh = PermissionRefreshToken.for_user(authenticated_user)
+    permissions_list = sorted(get_effective_permissions(authenticated_user))
+    log_action(authenticated_user, 'LOGIN', 'User', str(authenticated_user.id), 'User logged in successfully', request)
+    return {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': UserSerializer(authenticated_user).data,
+        'permissions': permissions_list,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--hasher', choices=HASHERS, default='md5')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory
+    from accounts.views import login_view
+    from companies.models import Company, User
+    from roles.models import Permission, Role, UserRole
+
+    with override_settings(PASSWORD_HASHERS=[HASHERS[args.hasher]], AUDIT_WRITE_MODE='sync'):
+        company = Company.objects.create(name='Bench')
+        role = Role.objects.create(name='Member')
+        role.permissions.set([Permission.objects.create(name=f'PERM_{i}') for i in range(20)])
+        password = 'S3cure-pass!'
+        template = User()
+        template.set_password(password)
+        users = User.objects.bulk_create(
+            User(username=f'user{i:05d}', email=f'person{i:05d}@example.com', company=company, password=template.password)
+            for i in range(args.users)
+        )
+        UserRole.objects.bulk_create(UserRole(user=user, role=role) for user in users)
+
+        factory = APIRequestFactory()
+        email = 'person00042@example.com'
+
+        def legacy():
+            legacy_login(factory.post('/api/auth/login/'), email, password)
+
+        def current():
+            request = factory.post('/api/auth/login/', {'email': email, 'password': password}, format='json')
+            assert login_view(request).status_code == 200
+
+        print(f'{args.users:,} users, {args.hasher} hasher, synchronous audit writes\n')
+        report('legacy login', *measure(legacy, args.iterations))
+        report('single-write login', *measure(current, args.iterations))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Login latency under concurrent clients: the sync login view run the way
+ASGI runs sync views (one shared thread) against the async view that
+verifies passwords in the bounded login pool.
+
+    python -m benchmarks.login_concurrency [--hash-iterations N] [--logins N]
+
+Reports p50/p99 latency at 1, 8 and 64 concurrent clients, plus how many
+requests the pool shed with a 429. Uses PBKDF2 with a reduced iteration
+budget by default so the run stays short; pass the production budget for
+realistic absolute numbers.
+"""
+import argparse
+import asyncio
+import time
+from .base import report, setup_django
+
+CONCURRENCY = [1, 8, 64]
+
+async def run_clients(view, factory, emails, clients, logins, password):
+    timings = []
+    rejected = 0
+
+    async def client(index):
+        nonlocal rejected
+        email = emails[index % len(emails)]
+        for _ in range(logins):
+            request = factory.post('/api/auth/login/', {'email': email, 'password': password}, format='json')
+            start = time.perf_counter()
+            response = await view(request)
+            elapsed = time.perf_counter() - start
+            if response.status_code == 429:
+                rejected += 1
+                continue
+            assert response.status_code == 200, response.content
+            timings.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(clients)))
+    return len(timings) / (time.perf_counter() - start), timings, rejected
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hash-iterations', type=int, default=100_000)
+    parser.add_argument('--logins', type=int, default=4, help='logins per client')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+    from django.test import override_settings
+    from rest_framework.test import APIRequestFactory
+    from accounts.views import async_login_view, render_login
+    from companies.models import Company, User
+
+    async def shared_thread_view(request):
+        return await sync_to_async(render_login)(request)
+
+    with override_settings(PASSWORD_HASHERS=['accounts.hashers.TunablePBKDF2PasswordHasher'],
+                           PASSWORD_HASH_ITERATIONS=args.hash_iterations,
+                           LOGIN_IP_ATTEMPTS=10**9):
+        company = Company.objects.create(name='Bench')
+        password = 'S3cure-pass!'
+        template = User()
+        template.set_password(password)
+        users = User.objects.bulk_create(
+            User(username=f'user{i:03d}', email=f'person{i:03d}@example.com', company=company, password=template.password)
+            for i in range(max(CONCURRENCY))
+        )
+        emails = [user.email for user in users]
+        factory = APIRequestFactory()
+
+        print(f'PBKDF2 x{args.hash_iterations:,}, {settings.LOGIN_POOL_WORKERS} pool workers, '
+              f'queue {settings.LOGIN_POOL_QUEUE}, {args.logins} logins per client\n')
+        for clients in CONCURRENCY:
+            for label, view in (('shared sync thread', shared_thread_view), ('async + login pool', async_login_view)):
+                ops, timings, rejected = asyncio.run(
+                    run_clients(view, factory, emails, clients, args.logins, password)
+                )
+                report(f'{label} x{clients}', ops, timings)
+                if rejected:
+                    print(f'{"":<40} {rejected} requests shed with 429')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+The old TenantSecurityMiddleware against the current middleware chain,
+where lockout is enforced by the JWT authentication class from cached state.
+
+    python -m benchmarks.middleware_overhead [--iterations N]
+
+Measures a JWT-authenticated API request, a session-authenticated non-API
+request (the admin) and a JWT request from a locked-out account, reporting
+throughput, status and queries per request.
+
+Both chains authenticate with the current JWT class, so they differ only in
+the old middleware, and that adds no queries. For JWT traffic it only saw
+the session user. For the admin it reused the user the session had already
+loaded. Removing it saves no queries, only a little per-request work. What
+the move into authentication buys is enforcement: the locked-out account
+gets 423 at zero queries, from cached state, on either chain.
+"""
+import argparse
+from datetime import timedelta
+from django.utils import timezone
+from .base import measure, report, setup_django
+
+class LegacyTenantSecurityMiddleware:
+    # The lockout check the middleware chain ran before (minus its unused
+    # helpers); it touched request.user on every request
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith('/api/auth/'):
+            return self.get_response(request)
+        if request.path.startswith('/api/') and not request.user.is_authenticated:
+            return self.get_response(request)
+        if (hasattr(request.user, 'locked_until') and
+                request.user.locked_until and
+                request.user.locked_until > timezone.now()):
+            from rest_framework.response import Response
+            return Response({'error': 'Account is locked due to failed login attempts'}, status=423)
+        return self.get_response(request)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from accounts.revocation import lock_user
+    from accounts.tokens import PermissionRefreshToken
+    from companies.models import Company, User
+    from roles.models import Permission, Role, UserRole
+
+    company = Company.objects.create(name='Bench')
+    user = User.objects.create_user(username='member', email='member@example.com', company=company, is_staff=True, is_superuser=True)
+    role = Role.objects.create(name='Viewer')
+    role.permissions.set([Permission.objects.create(name='VIEW_ROLES')])
+    UserRole.objects.create(user=user, role=role)
+    access = str(PermissionRefreshToken.for_user(user).access_token)
+
+    locked = User.objects.create_user(username='locked', email='locked@example.com', company=company, is_superuser=True)
+    locked_access = str(PermissionRefreshToken.for_user(locked).access_token)
+    # As a failed login that crosses the threshold records it
+    locked.locked_until = timezone.now() + timedelta(days=1)
+    locked.save(update_fields=['locked_until'])
+    lock_user(locked.pk, locked.locked_until)
+
+    current = list(settings.MIDDLEWARE)
+    auth_index = current.index('django.contrib.auth.middleware.AuthenticationMiddleware')
+    legacy = current[:auth_index + 1] + ['benchmarks.middleware_overhead.LegacyTenantSecurityMiddleware'] + current[auth_index + 1:]
+
+    api_client = Client(HTTP_AUTHORIZATION=f'Bearer {access}')
+    locked_client = Client(HTTP_AUTHORIZATION=f'Bearer {locked_access}')
+    admin_client = Client()
+    admin_client.force_login(user)
+    scenarios = [
+        ('JWT GET /api/roles/', lambda: api_client.get('/api/roles/')),
+        ('session GET /admin/jsi18n/', lambda: admin_client.get('/admin/jsi18n/')),
+        ('locked JWT GET /api/roles/', lambda: locked_client.get('/api/roles/')),
+    ]
+
+    for label, chain in (('legacy middleware', legacy), ('current', current)):
+        with override_settings(MIDDLEWARE=chain):
+            for scenario, request in scenarios:
+                request()
+                with CaptureQueriesContext(connection) as queries:
+                    status_code = request().status_code
+                # Read now: every request resets the connection's query log
+                query_count = len(queries)
+                report(f'{label}: {scenario}', *measure(request, args.iterations))
+                print(f'{"":<40} HTTP {status_code}, {query_count} queries per request')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare permission checks: the original per-role set union against the
+cached, bitset-compiled resolver in roles.utils.
+
+    python -m benchmarks.permission_check [--iterations N]
+"""
+import argparse
+import pickle
+from .base import measure, report, setup_django
+
+def legacy_permissions(user):
+    # The loop HasPermission used before permissions were compiled to masks
+    from roles.models import UserRole
+    user_roles = UserRole.objects.filter(user=user)
+    user_permissions = set()
+    for user_role in user_roles:
+        role_permissions = user_role.role.permissions.all()
+        user_permissions.update([perm.name for perm in role_permissions])
+    return user_permissions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--permissions', type=int, default=40)
+    parser.add_argument('--roles', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from companies.models import Company, User
+    from roles.models import Permission, Role, UserRole
+    from roles.utils import get_effective_mask, get_effective_permissions, has_permission, get_permission_catalog
+
+    company = Company.objects.create(name='Bench')
+    user = User.objects.create_user(username='bench', email='bench@example.com', password='x', company=company)
+    permissions = [Permission.objects.create(name=f'PERM_{i}') for i in range(args.permissions)]
+    for i in range(args.roles):
+        role = Role.objects.create(name=f'Role {i}')
+        role.permissions.set(permissions[i::args.roles + 1])
+        UserRole.objects.create(user=user, role=role)
+
+    target = permissions[0].name
+    names = get_effective_permissions(user)
+    mask = get_effective_mask(user)
+    bit = get_permission_catalog().bits[target]
+
+    print(f'{args.permissions} permissions, {args.roles} roles, {len(names)} effective permissions\n')
+    report('legacy set union (DB)', *measure(lambda: target in legacy_permissions(user), max(1, args.iterations // 20)))
+    report('cached name set', *measure(lambda: target in get_effective_permissions(user), args.iterations))
+    report('cached mask (has_permission)', *measure(lambda: has_permission(user, target), args.iterations))
+    report('raw bitwise test', *measure(lambda: mask >> bit & 1, args.iterations))
+
+    print(f'\ncached value size: name set {len(pickle.dumps(names))} bytes, mask {len(pickle.dumps(mask))} bytes')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+WebSocket capacity of one worker: N authenticated /ws/notifications/
+connections through JWTAuthMiddleware on the in-memory channel layer (no
+Redis needed), then role permission changes made through the REST API.
+
+    python -m benchmarks.websocket_fanout [--connections N] [--rounds N]
+
+Reports the connect rate, Python heap per connection (traced on a separate
+sample, since tracing slows everything down) and the latency from the
+REST call until each socket has received its permissionUpdate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from .base import percentile, setup_django
+
+CONNECT_BATCH = 200
+
+def scope_for(token):
+    return {
+        'type': 'websocket',
+        'path': '/ws/notifications/',
+        'query_string': f'token={token}'.encode(),
+        'headers': [],
+        'subprotocols': [],
+    }
+
+async def open_sockets(app, tokens):
+    from asgiref.testing import ApplicationCommunicator
+
+    async def open_socket(token):
+        socket = ApplicationCommunicator(app, scope_for(token))
+        await socket.send_input({'type': 'websocket.connect'})
+        message = await socket.receive_output(30)
+        assert message['type'] == 'websocket.accept', message
+        return socket
+
+    sockets = []
+    for start in range(0, len(tokens), CONNECT_BATCH):
+        sockets += await asyncio.gather(*(open_socket(token) for token in tokens[start:start + CONNECT_BATCH]))
+    return sockets
+
+async def close_sockets(sockets):
+    for socket in sockets:
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.gather(*(socket.wait(30) for socket in sockets))
+
+async def fan_out(sockets, change):
+    """Seconds from the start of the change until each socket got its message"""
+    from asgiref.sync import sync_to_async
+
+    latencies = []
+
+    async def receive(socket, start):
+        message = await socket.receive_output(60)
+        assert json.loads(message['text'])['type'] == 'permissionUpdate', message
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await sync_to_async(change)()
+    request_time = time.perf_counter() - start
+    await asyncio.gather(*(receive(socket, start) for socket in sockets))
+    return request_time, latencies
+
+def format_ms(seconds):
+    return f'{seconds * 1000:>9.1f}ms'
+
+async def run(args, app, tokens, change):
+    start = time.perf_counter()
+    sockets = await open_sockets(app, tokens[:args.connections])
+    elapsed = time.perf_counter() - start
+    print(f'{"connect " + str(len(sockets)) + " sockets":<40} {len(sockets) / elapsed:>12,.0f} conn/s  '
+          f'total {format_ms(elapsed)}')
+
+    latencies = []
+    request_times = []
+    for round_number in range(args.rounds):
+        request_time, round_latencies = await fan_out(sockets, lambda: change(round_number))
+        request_times.append(request_time)
+        latencies += round_latencies
+    print(f'{"REST assign_permissions":<40} p50 {format_ms(statistics.median(request_times))}  '
+          f'p99 {format_ms(percentile(request_times, 99))}')
+    print(f'{"fan-out to every socket":<40} p50 {format_ms(statistics.median(latencies))}  '
+          f'p99 {format_ms(percentile(latencies, 99))}  max {format_ms(max(latencies))}')
+    await close_sockets(sockets)
+
+    sample = tokens[args.connections:]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sockets = await open_sockets(app, sample)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{"heap per connection":<40} {(after - before) / len(sockets) / 1024:>12,.1f} KiB  '
+          f'(traced over {len(sockets)} sockets)')
+    await close_sockets(sockets)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--memory-sample', type=int, default=200)
+    args = parser.parse_args()
+
+    # In-memory channel layer and cache, whatever the environment says
+    os.environ.pop('REDIS_URL', None)
+    setup_django()
+
+    from channels.routing import URLRouter
+    from django.test import Client
+    from accounts.middleware import JWTAuthMiddleware
+    from accounts.tokens import PermissionRefreshToken
+    from companies.models import Company, User
+    from erp.routing import websocket_urlpatterns
+    from roles.models import Permission, Role, UserRole
+
+    company = Company.objects.create(name='Bench')
+    admin = User.objects.create_superuser(username='admin', email='admin@example.com', company=company)
+    role = Role.objects.create(name='Staff')
+    toggled = Permission.objects.create(name='CREATE_USER')
+    role.permissions.set([Permission.objects.create(name='VIEW_USERS')])
+
+    total = args.connections + args.memory_sample
+    users = User.objects.bulk_create(
+        User(username=f'user{i:05d}', email=f'person{i:05d}@example.com', company=company)
+        for i in range(total)
+    )
+    UserRole.objects.bulk_create(UserRole(user=user, role=role) for user in users)
+    tokens = [str(PermissionRefreshToken.for_user(user).access_token) for user in users]
+
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {PermissionRefreshToken.for_user(admin).access_token}')
+    url = f'/api/roles/{role.pk}/assign_permissions/'
+
+    def change(round_number):
+        # Alternately grant and revoke one permission, so every round is a delta
+        names = ['VIEW_USERS'] if round_number % 2 else ['VIEW_USERS', toggled.name]
+        response = client.post(url, {'permissions': names}, content_type='application/json')
+        assert response.status_code == 200, response.content
+
+    app = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+    print(f'{args.connections} connections, {args.rounds} role changes, in-memory channel layer\n')
+    asyncio.run(run(args, app, tokens, change))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+from roles.utils import resolve_permissions
+
+class RequestContext:
+    """
+    Identity and tenant of the current request, resolved once per request.
+
+    Built from the authenticated user (loaded by the JWT layer in one query,
+    or rebuilt from token claims with none) and the user's cached permission
+    mask. Tenant scoping works on company ids only, so it never triggers a
+    lazy load of the user's Company.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = bool(user and user.is_authenticated)
+        self.user_id = user.pk if self.is_authenticated else None
+        self.company_id = getattr(user, 'company_id', None) if self.is_authenticated else None
+        self.is_superuser = self.is_authenticated and user.is_superuser
+        self._permissions = None
+
+    def _resolve_permissions(self):
+        if self._permissions is None:
+            self._permissions = resolve_permissions(self.user)
+        return self._permissions
+
+    def has_permission(self, name):
+        if not self.is_authenticated:
+            return False
+        if self.is_superuser:
+            return True
+        catalog, mask = self._resolve_permissions()
+        bit = catalog.bits.get(name)
+        return bit is not None and bool(mask >> bit & 1)
+
+    @property
+    def permissions(self):
+        catalog, mask = self._resolve_permissions()
+        return frozenset(name for bit, name in catalog.names.items() if mask >> bit & 1)
+
+    def scope(self, queryset, field='company_id', unassigned_sees_all=False):
+        """
+        Restrict queryset to the caller's tenant: superusers see everything,
+        company members see rows whose `field` is their company, and users
+        without a company see nothing (or everything with unassigned_sees_all).
+        """
+        if self.is_superuser:
+            return queryset
+        if self.company_id is not None:
+            return queryset.filter(**{field: self.company_id})
+        return queryset if unassigned_sees_all else queryset.none()
+
+def get_request_context(request):
+    """The RequestContext for request, built on first use"""
+    # Kept on the underlying HttpRequest so DRF's Request wrapper and plain
+    # Django code share one instance
+    http_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+    context = getattr(http_request, 'erp_context', None)
+    if context is None or context.user is not user:
+        context = RequestContext(user)
+        http_request.erp_context = context
+    return context
@@ -0,0 +1,233 @@
+"""
+Streaming bulk import of users into a company.
+
+Rows are read one at a time from CSV or NDJSON and processed in chunks:
+each chunk is validated with a fixed number of queries, its passwords are
+hashed in a process pool, and its User, UserPassword and UserRole rows are
+written with bulk_create in one transaction. A bad row is reported with
+its row number instead of failing the import.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from accounts.hashers import hash_passwords
+from audit.utils import build_record, user_search_text
+from audit.writer import audit_writer
+from roles.models import Role, UserRole
+from .models import User, UserPassword
+
+FIELDS = ['username', 'email', 'first_name', 'last_name', 'password', 'roles', 'is_active']
+
+RowError = namedtuple('RowError', ['row', 'username', 'message'])
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+def read_rows(stream, fmt):
+    """Yield (row number, dict or None, parse error) from a CSV or NDJSON text stream"""
+    if fmt == 'csv':
+        # Row 1 is the header
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, row, None
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Expected a JSON object'
+            continue
+        yield number, row, None
+
+def parse_roles(value):
+    if isinstance(value, list):
+        return [str(name).strip() for name in value if str(name).strip()]
+    return [name.strip() for name in str(value or '').split(';') if name.strip()]
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n', 'off')
+
+class UserImporter:
+    """
+    Import users into `company`. `workers` is the size of the password
+    hashing pool (0 hashes inline); `progress` is called with the running
+    ImportResult after every chunk.
+    """
+
+    def __init__(self, company, chunk_size=500, workers=None, actor=None, progress=None):
+        self.company = company
+        self.chunk_size = chunk_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self.actor = actor
+        self.progress = progress
+        self.role_ids = dict(Role.objects.values_list('name', 'pk'))
+        self.seen_usernames = set()
+        self.seen_emails = set()
+
+    def run(self, rows):
+        result = ImportResult()
+        pool = None
+        if self.workers:
+            # Workers only hash; they never touch the database
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            rows = iter(rows)
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk, result, pool)
+                if self.progress:
+                    self.progress(result)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return result
+
+    def import_chunk(self, chunk, result, pool):
+        result.processed += len(chunk)
+        valid = []
+        for number, row, error in chunk:
+            if error is None:
+                row, error = self.clean(row)
+            if error is not None:
+                result.errors.append(RowError(number, row.get('username') or '' if row else '', error))
+            else:
+                valid.append((number, row))
+        valid = self.exclude_existing(valid, result)
+        if not valid:
+            return
+
+        passwords = [row['password'] for _, row in valid]
+        if pool is None:
+            hashes = hash_passwords(passwords)
+        else:
+            size = -(-len(passwords) // self.workers)
+            slices = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+            hashes = [password for part in pool.map(hash_passwords, slices) for password in part]
+
+        try:
+            created = self.write(valid, hashes)
+        except IntegrityError:
+            # A conflicting user was created concurrently; salvage row by row
+            created = []
+            for (number, row), password in zip(valid, hashes):
+                try:
+                    created += self.write([(number, row)], [password])
+                except IntegrityError:
+                    result.errors.append(RowError(number, row['username'], 'User already exists'))
+        result.created += len(created)
+        self.audit(created)
+
+    def clean(self, row):
+        """(cleaned row, None) or (row, error message)"""
+        row = {field: row.get(field) for field in FIELDS}
+        for field in ('username', 'email', 'first_name', 'last_name'):
+            row[field] = str(row[field] or '').strip()
+        row['password'] = str(row['password'] or '')
+        if not row['username']:
+            return row, 'username is required'
+        if not row['email']:
+            return row, 'email is required'
+        if not row['password']:
+            return row, 'password is required'
+        try:
+            User.username_validator(row['username'])
+            validate_email(row['email'])
+            # Field lengths match AbstractUser
+            for field, length in (('username', 150), ('first_name', 150), ('last_name', 150), ('email', 254)):
+                if len(row[field]) > length:
+                    raise ValidationError(f'{field} is longer than {length} characters')
+            validate_password(row['password'], user=User(username=row['username'], email=row['email']))
+        except ValidationError as e:
+            return row, ' '.join(e.messages)
+
+        row['roles'] = parse_roles(row['roles'])
+        unknown = [name for name in row['roles'] if name not in self.role_ids]
+        if unknown:
+            return row, f'Unknown roles: {", ".join(unknown)}'
+        row['is_active'] = True if row['is_active'] in (None, '') else parse_bool(row['is_active'])
+
+        email = row['email'].lower()
+        if row['username'] in self.seen_usernames:
+            return row, 'Duplicate username in import'
+        if email in self.seen_emails:
+            return row, 'Duplicate email in import'
+        self.seen_usernames.add(row['username'])
+        self.seen_emails.add(email)
+        return row, None
+
+    def exclude_existing(self, valid, result):
+        """Drop rows whose username or email is taken, with one query each for the chunk"""
+        if not valid:
+            return valid
+        usernames = set(User.objects.filter(username__in=[row['username'] for _, row in valid]).values_list('username', flat=True))
+        emails = set(
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=[row['email'].lower() for _, row in valid])
+            .values_list('email_lower', flat=True)
+        )
+        remaining = []
+        for number, row in valid:
+            if row['username'] in usernames:
+                result.errors.append(RowError(number, row['username'], 'Username already exists'))
+            elif row['email'].lower() in emails:
+                result.errors.append(RowError(number, row['username'], 'Email already exists'))
+            else:
+                remaining.append((number, row))
+        return remaining
+
+    def write(self, valid, hashes):
+        users = [
+            User(
+                username=row['username'], email=row['email'], first_name=row['first_name'],
+                last_name=row['last_name'], is_active=row['is_active'], password=password, company=self.company,
+            )
+            for (_, row), password in zip(valid, hashes)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            if any(user.pk is None for user in users):
+                # Backends that cannot return ids from a bulk insert
+                ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+            UserPassword.objects.bulk_create(
+                UserPassword(user_id=user.pk, password_text=row['password']) for user, (_, row) in zip(users, valid)
+            )
+            UserRole.objects.bulk_create(
+                UserRole(user_id=user.pk, role_id=self.role_ids[name])
+                for user, (_, row) in zip(users, valid) for name in row['roles']
+            )
+        return users
+
+    def audit(self, users):
+        actor_id = self.actor.pk if self.actor else None
+        # Recorded under the target company, so log_actions (actor's company) does not fit
+        user_search = user_search_text(self.actor)
+        audit_writer.write_many([
+            build_record(actor_id, self.company.pk, 'CREATE', 'User', str(user.pk), f'Imported user: {user.username}',
+                         user_search=user_search)
+            for user in users
+        ])
@@ -0,0 +1,67 @@
+import csv
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from companies.importer import UserImporter, read_rows
+from companies.models import Company, User
+
+class Command(BaseCommand):
+    help = 'Import users into a company from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or NDJSON file, or '-' for stdin")
+        parser.add_argument('--company', type=int, required=True, help='Company id')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows validated and written per transaction')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: CPU count, 0 = inline)')
+        parser.add_argument('--actor', help='Username recorded as the actor in the audit log')
+        parser.add_argument('--errors', help='Write the per-row error report to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} does not exist")
+        actor = None
+        if options['actor']:
+            actor = User.objects.filter(username=options['actor']).first()
+            if actor is None:
+                raise CommandError(f"User {options['actor']} does not exist")
+
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin')
+
+        start = time.perf_counter()
+
+        def progress(result):
+            elapsed = time.perf_counter() - start
+            self.stderr.write(
+                f'{result.processed} rows: {result.created} created, {result.failed} failed '
+                f'({result.processed / elapsed:,.0f} rows/s)'
+            )
+
+        importer = UserImporter(
+            company, chunk_size=options['chunk_size'], workers=options['workers'], actor=actor, progress=progress,
+        )
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            result = importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as report:
+                writer = csv.writer(report)
+                writer.writerow(['row', 'username', 'error'])
+                writer.writerows(sorted(result.errors))
+        else:
+            for error in sorted(result.errors):
+                self.stdout.write(f'row {error.row} ({error.username or "-"}): {error.message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} of {result.processed} users into {company.name} '
+            f'in {time.perf_counter() - start:.1f}s ({result.failed} failed)'
+        ))
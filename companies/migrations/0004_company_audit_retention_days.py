@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_alter_company_options_alter_company_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='audit_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
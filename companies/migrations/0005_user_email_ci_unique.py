@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:45
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('companies', 'User')
+    duplicates = list(
+        User.objects.exclude(email='')
+        .values(email_lower=Lower('email'))
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('email_lower', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Cannot add the case-insensitive unique email constraint; these emails '
+            f'belong to more than one user: {", ".join(duplicates)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('companies', '0004_company_audit_retention_days'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='user_email_ci_unique'),
+        ),
+    ]
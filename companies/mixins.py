@@ -1,5 +1,5 @@
-from rest_framework import permissions
 from rest_framework.exceptions import PermissionDenied
+from .context import get_request_context
 
 class CompanyIsolationMixin:
     """
@@ -7,50 +7,42 @@ class CompanyIsolationMixin:
     Ensures users can only access data within their assigned company.
     """
     
+    @property
+    def request_context(self):
+        return get_request_context(self.request)
+    
     def get_queryset(self):
         """Filter queryset to only include data from user's company"""
         queryset = super().get_queryset()
         
-        # Superusers can access all data across all companies
-        if self.request.user.is_superuser:
-            return queryset
-        
-        # Regular users can only access their company's data
-        if hasattr(self.request.user, 'company') and self.request.user.company:
-            if hasattr(queryset.model, 'company'):
-                return queryset.filter(company=self.request.user.company)
-            else:
-                return queryset.none()
-        
-        # Users without company get no data
-        return queryset.none()
+        # Models without a company are only visible to superusers
+        if not hasattr(queryset.model, 'company') and not self.request_context.is_superuser:
+            return queryset.none()
+        return self.request_context.scope(queryset)
     
     def perform_create(self, serializer):
         """Ensure created objects belong to appropriate company"""
+        context = self.request_context
         # Superusers can create for any company (handled in serializer)
-        if self.request.user.is_superuser:
+        if context.is_superuser:
             serializer.save()
+        # Regular users can only create for their company
+        elif context.company_id is not None:
+            serializer.save(company_id=context.company_id)
         else:
-            # Regular users can only create for their company
-            if hasattr(self.request.user, 'company') and self.request.user.company:
-                serializer.save(company=self.request.user.company)
-            else:
-                raise PermissionDenied("User must belong to a company")
+            raise PermissionDenied("User must belong to a company")
     
     def get_object(self):
         """Ensure retrieved object belongs to user's company"""
         obj = super().get_object()
+        context = self.request_context
         
         # Superusers can access any object across all companies
-        if self.request.user.is_superuser:
+        if context.is_superuser or not hasattr(obj, 'company_id'):
             return obj
         
-        # Check if object belongs to user's company
-        if hasattr(obj, 'company'):
-            if hasattr(self.request.user, 'company') and self.request.user.company:
-                if obj.company != self.request.user.company:
-                    raise PermissionDenied("Access denied: Object belongs to different company")
-            else:
-                raise PermissionDenied("User must belong to a company")
-        
-        return obj
\ No newline at end of file
+        if context.company_id is None:
+            raise PermissionDenied("User must belong to a company")
+        if obj.company_id != context.company_id:
+            raise PermissionDenied("Access denied: Object belongs to different company")
+        return obj
@@ -1,10 +1,14 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 class Company(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Days of audit history to keep; null falls back to AUDIT_RETENTION_DAYS
+    audit_retention_days = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -18,6 +22,16 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Login looks users up by email; blank emails are not unique
+            models.UniqueConstraint(Lower('email'), condition=~Q(email=''), name='user_email_ci_unique'),
+        ]
+
+def users_with_email(email):
+    """Case-insensitive email lookup that matches the user_email_ci_unique index"""
+    return User.objects.alias(email_lower=Lower('email')).filter(email_lower=email.lower()).exclude(email='')
+
 class UserPassword(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stored_password')
     password_text = models.CharField(max_length=255)
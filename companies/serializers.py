@@ -1,11 +1,11 @@
 from rest_framework import serializers
-from .models import Company, User, UserPassword
-from roles.models import UserRole
+from .context import get_request_context
+from .models import Company, User, UserPassword, users_with_email
 
 class CompanySerializer(serializers.ModelSerializer):
     class Meta:
         model = Company
-        fields = ['id', 'name', 'description', 'is_active', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'is_active', 'audit_retention_days', 'created_at', 'updated_at']
 
 class UserListSerializer(serializers.ModelSerializer):
     roles = serializers.SerializerMethodField()
@@ -16,9 +16,10 @@ class UserListSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'roles', 'current_password', 'company']
     
+    # These read from the select_related/prefetch caches set up by
+    # UserViewSet.get_queryset, so listing costs a fixed number of queries
     def get_roles(self, obj):
-        user_roles = UserRole.objects.filter(user=obj)
-        return [{'id': ur.role.id, 'name': ur.role.name} for ur in user_roles]
+        return [{'id': ur.role.id, 'name': ur.role.name} for ur in obj.user_roles.all()]
     
     def get_current_password(self, obj):
         try:
@@ -38,24 +39,32 @@ class UserCreateUpdateSerializer(serializers.ModelSerializer):
         model = User
         fields = ['username', 'email', 'first_name', 'last_name', 'password', 'is_active']
     
+    def validate_email(self, value):
+        # Emails are unique case-insensitively (user_email_ci_unique)
+        existing = users_with_email(value) if value else User.objects.none()
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError('A user with this email already exists.')
+        return value
+    
     def create(self, validated_data):
         password = validated_data.pop('password')
-        request_user = self.context['request'].user
+        request_context = get_request_context(self.context['request'])
         
         # Superusers can create users and assign them to any company
-        if request_user.is_superuser:
+        if request_context.is_superuser:
             # Company is optional for superusers - they can create users without company initially
             pass
         else:
             # Regular users can only create users for their company
-            if hasattr(request_user, 'company') and request_user.company:
-                validated_data['company'] = request_user.company
+            if request_context.company_id is not None:
+                validated_data['company_id'] = request_context.company_id
             else:
                 raise serializers.ValidationError('User must belong to a company')
         
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        # Hash once and insert once
+        user = User.objects.create_user(password=password, **validated_data)
         
         # Store readable password
         UserPassword.objects.create(user=user, password_text=password)
@@ -83,4 +92,32 @@ class UserCreateUpdateSerializer(serializers.ModelSerializer):
                 defaults={'password_text': password}
             )
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+# Upper bound on the (user, role) pairs one bulk assignment may write
+MAX_BULK_ROLE_ASSIGNMENTS = 10000
+
+class RoleAssignmentSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    role_id = serializers.IntegerField()
+
+class BulkRoleAssignmentSerializer(serializers.Serializer):
+    """Explicit (user, role) pairs, and/or every combination of user_ids x role_ids"""
+    assignments = serializers.ListField(child=RoleAssignmentSerializer(), required=False, max_length=MAX_BULK_ROLE_ASSIGNMENTS)
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=MAX_BULK_ROLE_ASSIGNMENTS)
+    role_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=MAX_BULK_ROLE_ASSIGNMENTS)
+    
+    def validate(self, attrs):
+        assignments = attrs.get('assignments', [])
+        user_ids, role_ids = set(attrs.get('user_ids') or ()), set(attrs.get('role_ids') or ())
+        if (user_ids or role_ids) and not (user_ids and role_ids):
+            raise serializers.ValidationError('user_ids and role_ids must be given together')
+        # Bounded before the cross product is built, so a small body cannot expand into millions of pairs
+        if len(user_ids) * len(role_ids) + len(assignments) > MAX_BULK_ROLE_ASSIGNMENTS:
+            raise serializers.ValidationError(f'At most {MAX_BULK_ROLE_ASSIGNMENTS} role assignments per request')
+        pairs = {(item['user_id'], item['role_id']) for item in assignments}
+        pairs.update((user_id, role_id) for user_id in user_ids for role_id in role_ids)
+        if not pairs:
+            raise serializers.ValidationError('No role assignments given')
+        attrs['pairs'] = sorted(pairs)
+        return attrs
@@ -1 +1,292 @@
-from django.test import TestCase
\ No newline at end of file
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from audit.filters import AuditLogFilter
+from audit.models import AuditLog
+from audit.utils import log_action
+from erp.testing import QueryCountMixin, count_queries
+from roles.models import Permission, Role, UserRole
+from roles.utils import get_effective_permissions, get_permission_version
+from .importer import UserImporter, read_rows
+from .models import Company, User, UserPassword
+
+class UserListQueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.admin = User.objects.create_user(username='admin', email='admin@acme.com', company=self.company)
+        role = Role.objects.create(name='User Admin')
+        role.permissions.add(Permission.objects.create(name='VIEW_USERS'))
+        UserRole.objects.create(user=self.admin, role=role)
+        self.roles = [Role.objects.create(name=f'Role {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_users(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'user{i}', email=f'user{i}@acme.com', company=self.company)
+            UserPassword.objects.create(user=user, password_text='x')
+            for role in self.roles[:i % 3 + 1]:
+                UserRole.objects.create(user=user, role=role)
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.add_users(3)
+        # users (+ company, stored password) and the user_roles prefetch
+        response = self.assertListingQueriesConstant('/api/users/', lambda: self.add_users(20), 2)
+        self.assertEqual(len(response.data), 24)
+
+    def test_listing_includes_prefetched_relations(self):
+        self.add_users(2)
+        _, response = self.get_listing('/api/users/')
+        row = next(item for item in response.data if item['username'] == 'user2')
+        self.assertEqual(row['company'], {'id': self.company.id, 'name': 'Acme'})
+        self.assertEqual(row['current_password'], 'x')
+        self.assertEqual(len(row['roles']), 3)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ViewSetQueryCountTests(TestCase):
+    """
+    Every action resolves identity, tenant and permissions once from the
+    request context; counts below are the action's own queries only.
+    """
+    PERMISSIONS = [
+        'VIEW_COMPANIES', 'CREATE_COMPANY', 'UPDATE_COMPANY', 'DELETE_COMPANY',
+        'VIEW_USERS', 'CREATE_USER', 'UPDATE_USER', 'DELETE_USER', 'ASSIGN_ROLES',
+        'VIEW_ROLES', 'UPDATE_ROLE', 'VIEW_PERMISSIONS', 'VIEW_AUDIT_LOGS',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        admin = User.objects.create_user(username='admin', email='admin@acme.com', company=self.company)
+        self.role = Role.objects.create(name='Admin')
+        self.role.permissions.set([Permission.objects.create(name=name) for name in self.PERMISSIONS])
+        UserRole.objects.create(user=admin, role=self.role)
+        self.member = User.objects.create_user(username='member', email='member@acme.com', company=self.company)
+        self.other_role = Role.objects.create(name='Viewer')
+        log_action(admin, 'LOGIN', 'User', str(admin.id), 'Successful login')
+
+        # As the JWT layer would load it: company not joined, mask cached
+        self.admin = User.objects.get(pk=admin.pk)
+        get_effective_permissions(self.admin)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def request(self, method, url, data=None):
+        count, response = count_queries(getattr(self.client, method), url, data, format='json')
+        self.assertLess(response.status_code, 300, response.data)
+        return count
+
+    def test_query_counts(self):
+        # Writes include the synchronous audit insert and rollup upsert
+        # (savepoint, insert, rollup update, then for a new bucket a
+        # savepoint, create and release, then the outer release)
+        expected = [
+            ('get', '/api/companies/', None, 1),
+            ('get', f'/api/companies/{self.company.id}/', None, 1),
+            ('patch', f'/api/companies/{self.company.id}/', {'description': 'x'}, 9),
+            ('get', '/api/users/', None, 2),
+            ('get', f'/api/users/{self.member.id}/', None, 2),
+            ('post', '/api/users/', {'username': 'new', 'email': 'new@acme.com', 'password': 'S3cure-pass!'}, 11),
+            ('patch', f'/api/users/{self.member.id}/', {'first_name': 'Mem'}, 11),
+            ('post', f'/api/users/{self.member.id}/assign_role/', {'role_id': self.other_role.id}, 14),
+            ('delete', f'/api/users/{self.member.id}/remove_role/', {'role_id': self.other_role.id}, 9),
+            ('delete', f'/api/users/{self.member.id}/', None, 16),
+            ('get', '/api/roles/', None, 2),
+            ('get', f'/api/roles/{self.role.id}/', None, 2),
+            ('get', '/api/permissions/', None, 1),
+            ('get', '/api/audit-logs/', None, 1),
+            ('get', '/api/audit-stats/', None, 1),
+        ]
+        for method, url, data, count in expected:
+            with self.subTest(f'{method} {url}'):
+                self.assertEqual(self.request(method, url, data), count)
+
+    def test_tenant_scoping_is_consistent(self):
+        other = Company.objects.create(name='Other')
+        outsider = User.objects.create_user(username='outsider', email='outsider@other.com', company=other)
+        log_action(outsider, 'LOGIN', 'User', str(outsider.id), 'Successful login')
+
+        self.assertEqual([c['id'] for c in self.client.get('/api/companies/').data], [self.company.id])
+        self.assertNotIn(outsider.id, [u['id'] for u in self.client.get('/api/users/').data])
+        self.assertEqual(self.client.get(f'/api/users/{outsider.id}/').status_code, 404)
+        self.assertEqual({log['user_name'] for log in self.client.get('/api/audit-logs/').data['results']}, {'admin'})
+
+class BulkRoleAssignmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.admin = User.objects.create_user(username='admin', email='admin@acme.com', company=self.company)
+        # Committed, so its notifications are not folded into the ones under test
+        with self.captureOnCommitCallbacks(execute=True):
+            admin_role = Role.objects.create(name='Admin')
+            admin_role.permissions.add(Permission.objects.create(name='ASSIGN_ROLES'))
+            UserRole.objects.create(user=self.admin, role=admin_role)
+        self.roles = [Role.objects.create(name=f'Role {i}') for i in range(3)]
+        get_effective_permissions(self.admin)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_users(self, count, company=None):
+        start = User.objects.count()
+        return [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@acme.com', company=company or self.company)
+            for i in range(start, start + count)
+        ]
+
+    def assign(self, data):
+        count, response = count_queries(self.client.post, '/api/users/bulk_assign_roles/', data, format='json')
+        return response, count
+
+    def test_cross_product_is_written_in_constant_queries(self):
+        users = self.add_users(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserRole.objects.create(user=users[0], role=self.roles[0])
+        versions = [get_permission_version(user.pk) for user in users]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response, small = self.assign({'user_ids': [u.pk for u in users], 'role_ids': [r.pk for r in self.roles[:2]]})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['assigned'], response.data['already_assigned'], response.data['users']), (5, 1, 3))
+        self.assertEqual(UserRole.objects.filter(user__in=users).count(), 6)
+        self.assertEqual(AuditLog.objects.filter(action='UPDATE', resource_type='User').count(), 5)
+        self.assertTrue(all(get_permission_version(u.pk) != v for u, v in zip(users, versions)))
+
+        more = self.add_users(20)
+        _, large = self.assign({'user_ids': [u.pk for u in more], 'role_ids': [r.pk for r in self.roles]})
+        # The first request also created the day's activity rollup row
+        # (savepoint, insert, release)
+        self.assertEqual(large, small - 3)
+        # lookups (users, roles), existing pairs, insert, audit insert and rollup
+        # update, plus two savepoints
+        self.assertEqual(large, 10)
+
+    def test_explicit_pairs_and_one_notification_per_user(self):
+        users = self.add_users(2)
+        pairs = [{'user_id': users[0].pk, 'role_id': role.pk} for role in self.roles]
+        pairs.append({'user_id': users[1].pk, 'role_id': self.roles[0].pk})
+        with mock.patch('accounts.notifications.notification_sender.send') as send, \
+                self.captureOnCommitCallbacks(execute=True):
+            response, _ = self.assign({'assignments': pairs})
+        self.assertEqual(response.data['assigned'], 4)
+        send.assert_called_once_with(([users[0].pk, users[1].pk], []))
+
+    def test_other_tenants_are_rejected_without_writing(self):
+        outsider, = self.add_users(1, company=Company.objects.create(name='Other'))
+        member, = self.add_users(1)
+        response, _ = self.assign({'user_ids': [member.pk, outsider.pk], 'role_ids': [self.roles[0].pk, 999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual((response.data['user_ids'], response.data['role_ids']), ([outsider.pk], [999]))
+        self.assertFalse(UserRole.objects.filter(user=member).exists())
+
+    def test_caller_without_company_is_rejected_without_writing(self):
+        unassigned = User.objects.create_user(username='unassigned', email='unassigned@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserRole.objects.create(user=unassigned, role=Role.objects.get(name='Admin'))
+        outsider, = self.add_users(1, company=Company.objects.create(name='Other'))
+        self.client.force_authenticate(unassigned)
+
+        single = self.client.post(f'/api/users/{outsider.pk}/assign_role/', {'role_id': self.roles[0].pk}, format='json')
+        self.assertEqual(single.status_code, 403)
+        response, _ = self.assign({'user_ids': [outsider.pk], 'role_ids': [self.roles[0].pk]})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(UserRole.objects.filter(user=outsider).exists())
+
+    def test_oversized_cross_product_is_rejected_before_expansion(self):
+        # 25 million pairs if it were expanded
+        response, queries = self.assign({'user_ids': list(range(1, 5001)), 'role_ids': list(range(1, 5001))})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most', str(response.data))
+        self.assertEqual(queries, 0)
+
+    def test_requires_assign_roles(self):
+        member, = self.add_users(1)
+        self.client.force_authenticate(member)
+        response, _ = self.assign({'user_ids': [member.pk], 'role_ids': [self.roles[0].pk]})
+        self.assertEqual(response.status_code, 403)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.staff = Role.objects.create(name='Staff')
+        self.viewer = Role.objects.create(name='Viewer')
+        User.objects.create_user(username='taken', email='Taken@acme.com')
+
+    def rows(self, count, start=0):
+        return [
+            {'username': f'emp{i}', 'email': f'emp{i}@acme.com', 'password': f'Str0ng-pass-{i}', 'roles': 'Staff;Viewer'}
+            for i in range(start, start + count)
+        ]
+
+    def ndjson(self, rows):
+        return io.StringIO(''.join((row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows))
+
+    def test_valid_rows_are_written_in_chunks_with_an_error_report(self):
+        rows = self.rows(5) + [
+            {'username': 'emp0', 'email': 'other@acme.com', 'password': 'Str0ng-pass-x'},
+            {'username': 'weak', 'email': 'weak@acme.com', 'password': '123'},
+            {'username': 'ghost', 'email': 'ghost@acme.com', 'password': 'Str0ng-pass-g', 'roles': ['Nope']},
+            {'username': 'dupe', 'email': 'TAKEN@acme.com', 'password': 'Str0ng-pass-d'},
+            '{not json',
+        ] + self.rows(2, start=5)
+        progress = []
+        importer = UserImporter(self.company, chunk_size=4, workers=0, progress=lambda r: progress.append(r.processed))
+        result = importer.run(read_rows(self.ndjson(rows), 'ndjson'))
+
+        self.assertEqual((result.processed, result.created, result.failed), (12, 7, 5))
+        self.assertEqual(progress, [4, 8, 12])
+        self.assertEqual([(e.row, e.username) for e in sorted(result.errors)],
+                         [(6, 'emp0'), (7, 'weak'), (8, 'ghost'), (9, 'dupe'), (10, '')])
+
+        imported = User.objects.filter(company=self.company)
+        self.assertEqual(imported.count(), 7)
+        user = imported.get(username='emp6')
+        self.assertTrue(user.check_password('Str0ng-pass-6'))
+        self.assertEqual(user.stored_password.password_text, 'Str0ng-pass-6')
+        self.assertEqual(UserRole.objects.filter(user__company=self.company).count(), 14)
+        self.assertEqual(AuditLog.objects.filter(action='CREATE', resource_type='User').count(), 7)
+
+    def test_validation_queries_do_not_grow_with_chunk_size(self):
+        def count(rows, start):
+            importer = UserImporter(self.company, chunk_size=1000, workers=0)
+            return count_queries(importer.run, read_rows(self.ndjson(self.rows(rows, start)), 'ndjson'))[0]
+
+        count(1, 0)  # creates the day's audit rollup
+        self.assertEqual(count(5, 10), count(50, 100))
+
+    def test_passwords_can_be_hashed_in_a_process_pool(self):
+        importer = UserImporter(self.company, chunk_size=10, workers=2)
+        result = importer.run(read_rows(self.ndjson(self.rows(12)), 'ndjson'))
+        self.assertEqual(result.created, 12)
+        self.assertTrue(User.objects.get(username='emp11').check_password('Str0ng-pass-11'))
+
+    def test_command_imports_csv_and_writes_error_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'users.csv')
+            report = os.path.join(directory, 'errors.csv')
+            with open(source, 'w', newline='') as f:
+                f.write('username,email,first_name,password,roles\n')
+                f.write('ann,ann@acme.com,Ann,Str0ng-pass-a,Staff\n')
+                f.write('bad name!,bad@acme.com,,Str0ng-pass-b,\n')
+            stdout = io.StringIO()
+            call_command('import_users', source, company=self.company.pk, workers=0, errors=report,
+                         actor='taken', stdout=stdout, stderr=io.StringIO())
+            with open(report) as f:
+                lines = f.read().splitlines()
+
+        self.assertIn('Imported 1 of 2 users', stdout.getvalue())
+        self.assertEqual(lines[0], 'row,username,error')
+        self.assertTrue(lines[1].startswith('3,bad name!,'))
+        self.assertEqual(User.objects.get(username='ann').first_name, 'Ann')
+        # The actor's import activity is found by the audit user filter
+        found = AuditLogFilter({'user': 'Taken@Acme'}, queryset=AuditLog.objects.all()).qs
+        self.assertEqual(list(found.values_list('details', flat=True)), ['Imported user: ann'])
@@ -1,11 +1,15 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import Prefetch
 from .models import Company, User
-from .serializers import CompanySerializer, UserListSerializer, UserCreateUpdateSerializer
+from .serializers import BulkRoleAssignmentSerializer, CompanySerializer, UserListSerializer, UserCreateUpdateSerializer
 from .mixins import CompanyIsolationMixin
 from roles.models import UserRole, Role
-from audit.utils import log_action
+from roles.signals import user_roles_changed
+from audit.utils import log_action, log_actions
 from .permissions import HasPermission
 
 class CompanyViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
@@ -13,15 +17,9 @@ class CompanyViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        # Super admin can see all companies
-        if self.request.user.is_superuser:
-            return Company.objects.all()
-        # Users with company see only their own
-        elif hasattr(self.request.user, 'company') and self.request.user.company:
-            return Company.objects.filter(id=self.request.user.company.id)
-        # Users without company but with VIEW_COMPANIES permission can see all
-        else:
-            return Company.objects.all()
+        # Super admins see all companies, members only their own; users
+        # without a company (gated by VIEW_COMPANIES) see all
+        return self.request_context.scope(Company.objects.all(), field='id', unassigned_sees_all=True)
     
     def get_permissions(self):
         if self.action == 'list':
@@ -53,15 +51,13 @@ class UserViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        # Superusers can see all users
-        if self.request.user.is_superuser:
-            return User.objects.all()
-        # Users with company see only their company users
-        elif hasattr(self.request.user, 'company') and self.request.user.company:
-            return User.objects.filter(company=self.request.user.company)
-        # Users without company but with VIEW_USERS permission can see all
-        else:
-            return User.objects.all()
+        # Load everything UserListSerializer reads in a fixed number of queries
+        queryset = User.objects.select_related('company', 'stored_password').prefetch_related(
+            Prefetch('user_roles', queryset=UserRole.objects.select_related('role'))
+        )
+        # Superusers see all users, members their company's users; users
+        # without a company (gated by VIEW_USERS) see all
+        return self.request_context.scope(queryset, unassigned_sees_all=True)
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -97,7 +93,7 @@ class UserViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def assign_company(self, request, pk=None):
         """Assign company to user (superuser only)"""
-        if not request.user.is_superuser:
+        if not self.request_context.is_superuser:
             return Response({'error': 'Only superusers can assign companies'}, status=status.HTTP_403_FORBIDDEN)
         
         user = self.get_object()
@@ -119,16 +115,9 @@ class UserViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
         user = self.get_object()
         role_id = request.data.get('role_id')
         
-        # Check permissions
-        if not request.user.is_superuser:
-            user_roles = UserRole.objects.filter(user=request.user)
-            user_permissions = set()
-            for user_role in user_roles:
-                role_permissions = user_role.role.permissions.all()
-                user_permissions.update([perm.name for perm in role_permissions])
-            
-            if 'ASSIGN_ROLES' not in user_permissions:
-                return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        # Check permissions (superusers always pass)
+        if not self.request_context.has_permission('ASSIGN_ROLES'):
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
         try:
             # Get role (roles are system-wide now)
@@ -139,28 +128,6 @@ class UserViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
             if created:
                 log_action(request.user, 'UPDATE', 'UserRole', str(user_role.id), f'Assigned role {role.name} to user {user.username}', request)
                 
-                # Send real-time notification
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    # Get updated permissions
-                    user_roles = UserRole.objects.filter(user=user)
-                    permissions = set()
-                    for ur in user_roles:
-                        role_permissions = ur.role.permissions.all()
-                        permissions.update([perm.name for perm in role_permissions])
-                    
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{user.id}",
-                        {
-                            "type": "permission_update",
-                            "user_id": user.id,
-                            "permissions": list(permissions)
-                        }
-                    )
-                
                 return Response({'message': 'Role assigned successfully'})
             else:
                 return Response({'message': 'Role already assigned'})
@@ -182,30 +149,58 @@ class UserViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
                 user_role.delete()
                 log_action(request.user, 'UPDATE', 'UserRole', str(user_role.id), f'Removed role {role.name} from user {user.username}', request)
                 
-                # Send real-time notification
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    # Get updated permissions
-                    user_roles = UserRole.objects.filter(user=user)
-                    permissions = set()
-                    for ur in user_roles:
-                        role_permissions = ur.role.permissions.all()
-                        permissions.update([perm.name for perm in role_permissions])
-                    
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{user.id}",
-                        {
-                            "type": "permission_update",
-                            "user_id": user.id,
-                            "permissions": list(permissions)
-                        }
-                    )
-                
                 return Response({'message': 'Role removed successfully'})
             else:
                 return Response({'message': 'Role not assigned to user'})
         except Role.DoesNotExist:
-            return Response({'error': 'Role not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Role not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk_assign_roles(self, request):
+        """Assign many (user, role) pairs in one transaction"""
+        # get_permissions() replaces action-level permission classes, so check here
+        if not self.request_context.has_permission('ASSIGN_ROLES'):
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        # As get_object() does for assign_role: a caller without a company has no tenant to assign in
+        context = self.request_context
+        if not context.is_superuser and context.company_id is None:
+            raise PermissionDenied("User must belong to a company")
+        
+        serializer = BulkRoleAssignmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        pairs = serializer.validated_data['pairs']
+        user_ids = {user_id for user_id, _ in pairs}
+        role_ids = {role_id for _, role_id in pairs}
+        
+        # Tenancy for every target user in one query, as get_object() checks it per user
+        users = dict(context.scope(User.objects.filter(pk__in=user_ids)).values_list('pk', 'username'))
+        roles = dict(Role.objects.filter(pk__in=role_ids).values_list('pk', 'name'))
+        missing = {}
+        if user_ids - users.keys():
+            missing['user_ids'] = sorted(user_ids - users.keys())
+        if role_ids - roles.keys():
+            missing['role_ids'] = sorted(role_ids - roles.keys())
+        if missing:
+            return Response({'error': 'Users or roles not found', **missing}, status=status.HTTP_404_NOT_FOUND)
+        
+        with transaction.atomic():
+            existing = set(UserRole.objects.filter(user_id__in=user_ids, role_id__in=role_ids).values_list('user_id', 'role_id'))
+            new_pairs = [pair for pair in pairs if pair not in existing]
+            # Pairs inserted concurrently since the read are skipped by the unique constraint
+            UserRole.objects.bulk_create([UserRole(user_id=user_id, role_id=role_id) for user_id, role_id in new_pairs], ignore_conflicts=True)
+            affected = {user_id for user_id, _ in new_pairs}
+            if affected:
+                user_roles_changed(affected)
+        
+        log_actions(request.user, [
+            ('UPDATE', 'User', str(user_id), f'Assigned role {roles[role_id]} to user {users[user_id]}')
+            for user_id, role_id in new_pairs
+        ], request)
+        return Response({
+            'message': 'Roles assigned successfully',
+            'assigned': len(new_pairs),
+            'already_assigned': len(pairs) - len(new_pairs),
+            'users': len(affected),
+        })
@@ -1,6 +1,7 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -8,6 +9,8 @@ load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-gk0*cppqd%%!ri-5l#f$vfejqa0^^bt*2t#8x3dd^o^q(k#zer')
 
 DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
@@ -39,7 +42,6 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'companies.middleware.TenantSecurityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,10 +87,55 @@ else:
         }
     }
 
+# Cache configuration
+if os.environ.get('REDIS_URL'):
+    # Shared cache so permission invalidations are seen by every worker
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    # Local memory cache is per process, so keep cached permissions short-lived.
+    # Revocation, lockout and rate limits need a shared cache: with DEBUG off
+    # this fails the accounts.E001 system check
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'erp-default',
+        }
+    }
+
+# Channel layer for WebSocket notifications: Redis so every worker process
+# reaches every socket, in-memory for a single development process
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ.get('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Permission notifications are sent after commit from a background thread.
+# The in-memory layer can only be used from the server's own event loop, so
+# without Redis (and in tests) they are sent inline from the request instead
+NOTIFICATION_MODE = 'async' if os.environ.get('REDIS_URL') and not TESTING else 'sync'
+
+# Seconds an effective-permission set stays cached (entries are also
+# invalidated immediately by permission version bumps)
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 3600 if os.environ.get('REDIS_URL') else 60))
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.PermissionClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -102,6 +149,16 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Embed the effective permission mask in access tokens so authenticated
+# requests skip the database until the user's permissions change
+JWT_EMBED_PERMISSIONS = os.environ.get('JWT_EMBED_PERMISSIONS', 'False').lower() == 'true'
+
+# Revoked tokens are tracked in the cache. The optional per-process Bloom
+# filter lets unrevoked tokens skip the cache; a token revoked by another
+# process may be accepted for up to TOKEN_REVOCATION_BLOOM_REFRESH seconds.
+TOKEN_REVOCATION_BLOOM = os.environ.get('TOKEN_REVOCATION_BLOOM', 'False').lower() == 'true'
+TOKEN_REVOCATION_BLOOM_REFRESH = 5
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -112,6 +169,23 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 # Password validation
+# Password hashing policy: PASSWORD_HASH_ALGORITHM hashes new passwords and
+# the remaining hashers only verify existing ones. Changing the algorithm or
+# PASSWORD_HASH_ITERATIONS (PBKDF2 only; empty keeps Django's default)
+# rehashes each password on its next successful login. argon2 and bcrypt need
+# argon2-cffi / bcrypt installed.
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2')
+PASSWORD_HASH_ITERATIONS = int(os.environ['PASSWORD_HASH_ITERATIONS']) if os.environ.get('PASSWORD_HASH_ITERATIONS') else None
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASH_ALGORITHM]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASH_ALGORITHM
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -128,9 +202,34 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Audit logging: 'async' buffers records and bulk-inserts them from a
+# background thread, 'sync' writes each record inline (used by the test suite)
+AUDIT_WRITE_MODE = os.environ.get('AUDIT_WRITE_MODE', 'sync' if TESTING else 'async')
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+AUDIT_FLUSH_INTERVAL_MS = int(os.environ.get('AUDIT_FLUSH_INTERVAL_MS', 500))
+AUDIT_MAX_QUEUE = int(os.environ.get('AUDIT_MAX_QUEUE', 50000))
+
+# Audit retention: days of history kept for companies without their own
+# audit_retention_days (empty keeps history forever). With
+# AUDIT_PARTITIONING on PostgreSQL the table is partitioned by month and
+# expired months are dropped by `manage.py maintain_audit_logs`.
+AUDIT_RETENTION_DAYS = int(os.environ['AUDIT_RETENTION_DAYS']) if os.environ.get('AUDIT_RETENTION_DAYS') else None
+AUDIT_PARTITIONING = os.environ.get('AUDIT_PARTITIONING', 'False').lower() == 'true'
+AUDIT_PARTITION_MONTHS_AHEAD = 3
+
 # Security Settings
 ACCOUNT_LOCKOUT_ATTEMPTS = 5
 ACCOUNT_LOCKOUT_TIME = 300  # 5 minutes
+# Failed logins allowed from one client IP per window before it is blocked
+LOGIN_IP_ATTEMPTS = 20
+LOGIN_IP_WINDOW = 300
+
+# Password verification for logins runs in a bounded thread pool; requests
+# beyond LOGIN_POOL_WORKERS running plus LOGIN_POOL_QUEUE waiting get a 429.
+# Tests verify inline so they stay inside the test transaction.
+LOGIN_POOL_MODE = 'inline' if TESTING else 'pool'
+LOGIN_POOL_WORKERS = int(os.environ.get('LOGIN_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+LOGIN_POOL_QUEUE = int(os.environ.get('LOGIN_POOL_QUEUE', 32))
 
 
 
@@ -145,4 +244,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom User Model
-AUTH_USER_MODEL = 'companies.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'companies.User'
+
+AUTHENTICATION_BACKENDS = [
+    # Login passes the user it already looked up by email; admin uses username
+    'accounts.backends.PreloadedUserBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
@@ -0,0 +1,29 @@
+"""Helpers shared by the apps' test suites."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+def count_queries(func, *args, **kwargs):
+    """Call func and return (number of queries it ran, its result)"""
+    with CaptureQueriesContext(connection) as queries:
+        result = func(*args, **kwargs)
+    return len(queries), result
+
+class QueryCountMixin:
+    """For API test cases whose listings must not run more queries as rows are added"""
+
+    def get_listing(self, url):
+        count, response = count_queries(self.client.get, url)
+        self.assertEqual(response.status_code, 200)
+        return count, response
+
+    def assertListingQueriesConstant(self, url, add_rows, expected):
+        """
+        GET `url` once to warm caches, then before and after `add_rows()`:
+        both must run exactly `expected` queries. Returns the last response.
+        """
+        self.get_listing(url)
+        before, _ = self.get_listing(url)
+        add_rows()
+        after, response = self.get_listing(url)
+        self.assertEqual((before, after), (expected, expected))
+        return response
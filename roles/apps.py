@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class RolesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'roles'
\ No newline at end of file
+    name = 'roles'
+
+    def ready(self):
+        from . import signals  # noqa: F401
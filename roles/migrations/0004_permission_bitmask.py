@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:31
+
+from django.db import migrations, models
+
+
+def assign_bits(apps, schema_editor):
+    Permission = apps.get_model('roles', 'Permission')
+    Role = apps.get_model('roles', 'Role')
+
+    for bit, permission in enumerate(Permission.objects.order_by('id')):
+        permission.bit = bit
+        permission.save(update_fields=['bit'])
+
+    for role in Role.objects.all():
+        mask = 0
+        for bit in role.permissions.values_list('bit', flat=True):
+            mask |= 1 << bit
+        role.permission_mask = mask
+        role.save(update_fields=['permission_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('roles', '0003_alter_role_unique_together_alter_role_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permission',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='role',
+            name='permission_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(assign_bits, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,52 @@
 from django.db import models
 from companies.models import User, Company
 
+# Role masks are stored in a signed 64-bit column
+MAX_PERMISSION_BITS = 63
+
 class Permission(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            self.bit = self.next_free_bit()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def next_free_bit(cls):
+        """Lowest bit index not used by any permission"""
+        used = set(cls.objects.exclude(bit=None).values_list('bit', flat=True))
+        for bit in range(MAX_PERMISSION_BITS):
+            if bit not in used:
+                return bit
+        raise ValueError(f'Cannot define more than {MAX_PERMISSION_BITS} permissions')
+
 class Role(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     permissions = models.ManyToManyField(Permission, blank=True)
     is_system = models.BooleanField(default=False)
+    # OR of 1 << permission.bit over self.permissions, kept in sync by signals
+    permission_mask = models.BigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def refresh_permission_mask(self):
+        mask = 0
+        for bit in self.permissions.values_list('bit', flat=True):
+            mask |= 1 << bit
+        Role.objects.filter(pk=self.pk).update(permission_mask=mask)
+        self.permission_mask = mask
+        return mask
+
 class UserRole(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_roles')
     role = models.ForeignKey(Role, on_delete=models.CASCADE)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Role, Permission, UserRole
+from .utils import get_permission_catalog
 
 class PermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,4 +32,21 @@ class RoleCreateUpdateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 class AssignPermissionsSerializer(serializers.Serializer):
-    permissions = serializers.ListField(child=serializers.CharField())
\ No newline at end of file
+    permissions = serializers.ListField(child=serializers.CharField())
+
+class PatchPermissionsSerializer(serializers.Serializer):
+    add = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    remove = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    
+    def validate(self, attrs):
+        add, remove = set(attrs['add']), set(attrs['remove'])
+        # Checked against the cached catalog rather than a query per request
+        unknown = (add | remove) - get_permission_catalog().bits.keys()
+        if unknown:
+            raise serializers.ValidationError(f'Unknown permissions: {", ".join(sorted(unknown))}')
+        if add & remove:
+            raise serializers.ValidationError(f'Both added and removed: {", ".join(sorted(add & remove))}')
+        if not add and not remove:
+            raise serializers.ValidationError('Nothing to add or remove')
+        attrs['add'], attrs['remove'] = sorted(add), sorted(remove)
+        return attrs
@@ -0,0 +1,87 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from accounts.notifications import notify_permissions_changed, notify_roles_changed
+from companies.models import User
+from .models import Permission, Role, UserRole
+from .utils import bump_catalog_version, bump_permission_versions, bump_role_holder_versions
+
+# Both run after the current transaction commits. Versions are bumped before
+# notifying, so the bump callback is registered first and notifications
+# always carry the new versions.
+
+def user_roles_changed(user_ids):
+    """
+    Invalidate cached permissions of users whose roles changed and notify
+    them. Bulk writes, which send no model signals, call this directly.
+    """
+    bump_permission_versions(user_ids)
+    notify_permissions_changed(user_ids)
+
+def roles_changed(role_ids):
+    """
+    Invalidate cached permissions of every holder of roles whose permissions
+    changed and notify them. Bulk writes, which send no model signals, call
+    this directly.
+    """
+    bump_role_holder_versions(role_ids)
+    # Holders hear about it through the role groups, not one message each
+    notify_roles_changed(role_ids)
+
+@receiver(post_save, sender=UserRole)
+def user_role_saved(sender, instance, created, **kwargs):
+    if created:
+        user_roles_changed([instance.user_id])
+
+@receiver(post_delete, sender=UserRole)
+def user_role_deleted(sender, instance, **kwargs):
+    user_roles_changed([instance.user_id])
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def role_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Only needed to tell connected holders; the clear itself is handled below
+        instance._cleared_role_ids = list(instance.role_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # permission.role_set.clear() does not tell us which roles were affected
+        if pk_set is None:
+            Role.objects.update(permission_mask=F('permission_mask').bitand(~(1 << instance.bit)))
+            bump_catalog_version()
+            notify_roles_changed(instance.__dict__.pop('_cleared_role_ids', []))
+            return
+        for role in Role.objects.filter(pk__in=pk_set):
+            role.refresh_permission_mask()
+        role_ids = pk_set
+    else:
+        instance.refresh_permission_mask()
+        role_ids = [instance.pk]
+
+    roles_changed(role_ids)
+
+@receiver(post_delete, sender=Permission)
+def permission_deleted(sender, instance, **kwargs):
+    # Free the bit so it can be reused by a future permission
+    if instance.bit is not None:
+        Role.objects.update(permission_mask=F('permission_mask').bitand(~(1 << instance.bit)))
+    bump_catalog_version()
+
+@receiver(post_save, sender=Permission)
+def permission_saved(sender, **kwargs):
+    bump_catalog_version()
+
+# Login bookkeeping that no token claim depends on
+LOGIN_BOOKKEEPING_FIELDS = {'last_login', 'failed_login_attempts', 'locked_until'}
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Tokens embed identity and superuser status alongside the permission
+    # mask, so any change to the user row must make them stale
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= LOGIN_BOOKKEEPING_FIELDS:
+        return
+    bump_permission_versions([instance.pk])
@@ -1 +1,227 @@
-from django.test import TestCase
\ No newline at end of file
+from types import SimpleNamespace
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from companies.models import Company, User
+from companies.permissions import HasPermission
+from erp.testing import QueryCountMixin
+from .models import Permission, Role, UserRole
+from .utils import (
+    get_effective_mask, get_effective_permissions, get_permission_version, has_permission, mask_to_names, names_to_mask,
+)
+
+class EffectivePermissionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Acme')
+        self.user = User.objects.create_user(username='alice', email='alice@acme.com', password='x', company=self.company)
+        self.view_users = Permission.objects.create(name='VIEW_USERS')
+        self.create_user = Permission.objects.create(name='CREATE_USER')
+        # Committed, so later version bumps are not folded into these
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role = Role.objects.create(name='Viewer')
+            self.role.permissions.add(self.view_users)
+            UserRole.objects.create(user=self.user, role=self.role)
+
+    def test_warm_permission_check_hits_no_queries(self):
+        request = SimpleNamespace(user=self.user)
+        permission = HasPermission('VIEW_USERS')()
+        self.assertTrue(permission.has_permission(request, None))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_permission(request, None))
+            self.assertFalse(HasPermission('CREATE_USER')().has_permission(request, None))
+
+    def test_role_assignment_invalidates_cache(self):
+        self.assertEqual(get_effective_permissions(self.user), {'VIEW_USERS'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            editor = Role.objects.create(name='Editor')
+            editor.permissions.add(self.create_user)
+            user_role = UserRole.objects.create(user=self.user, role=editor)
+        self.assertEqual(get_effective_permissions(self.user), {'VIEW_USERS', 'CREATE_USER'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_role.delete()
+        self.assertEqual(get_effective_permissions(self.user), {'VIEW_USERS'})
+
+    def test_role_permission_change_invalidates_holders_only(self):
+        other = User.objects.create_user(username='bob', email='bob@acme.com', password='x', company=self.company)
+        get_effective_permissions(self.user)
+        get_effective_permissions(other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.permissions.set([self.view_users, self.create_user])
+        self.assertEqual(get_effective_permissions(self.user), {'VIEW_USERS', 'CREATE_USER'})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_effective_permissions(other), frozenset())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.permissions.clear()
+        self.assertEqual(get_effective_permissions(self.user), frozenset())
+
+    def test_superuser_gets_every_permission(self):
+        admin = User.objects.create_superuser(username='root', email='root@acme.com', password='x')
+        self.assertEqual(get_effective_permissions(admin), {'VIEW_USERS', 'CREATE_USER'})
+
+        Permission.objects.create(name='VIEW_AUDIT_LOGS')
+        self.assertIn('VIEW_AUDIT_LOGS', get_effective_permissions(admin))
+
+class PermissionBitmaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.view = Permission.objects.create(name='VIEW_ROLES')
+        self.create = Permission.objects.create(name='CREATE_ROLE')
+        self.delete = Permission.objects.create(name='DELETE_ROLE')
+        self.role = Role.objects.create(name='Manager')
+
+    def test_permissions_get_distinct_stable_bits(self):
+        bits = {self.view.bit, self.create.bit, self.delete.bit}
+        self.assertEqual(len(bits), 3)
+
+        self.view.description = 'Can view roles'
+        self.view.save()
+        self.view.refresh_from_db()
+        self.assertIn(self.view.bit, bits)
+
+    def test_role_mask_follows_permission_set(self):
+        self.role.permissions.set([self.view, self.delete])
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.permission_mask, (1 << self.view.bit) | (1 << self.delete.bit))
+
+        self.role.permissions.remove(self.view)
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.permission_mask, 1 << self.delete.bit)
+
+    def test_deleting_permission_clears_its_bit(self):
+        self.role.permissions.set([self.view, self.create])
+        bit = self.create.bit
+        self.create.delete()
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.permission_mask, 1 << self.view.bit)
+        self.assertEqual(Permission.objects.create(name='REUSED').bit, bit)
+
+    def test_mask_name_conversion_round_trips(self):
+        mask = names_to_mask(['DELETE_ROLE', 'VIEW_ROLES', 'UNKNOWN'])
+        self.assertEqual(mask_to_names(mask), ['DELETE_ROLE', 'VIEW_ROLES'])
+        self.assertEqual(mask_to_names(0), [])
+
+    def test_effective_mask_is_or_of_role_masks(self):
+        user = User.objects.create_user(username='carol', email='carol@acme.com', password='x')
+        other = Role.objects.create(name='Creator')
+        self.role.permissions.set([self.view])
+        other.permissions.set([self.create])
+        UserRole.objects.create(user=user, role=self.role)
+        UserRole.objects.create(user=user, role=other)
+
+        self.assertEqual(get_effective_mask(user), names_to_mask(['VIEW_ROLES', 'CREATE_ROLE']))
+        self.assertTrue(has_permission(user, 'CREATE_ROLE'))
+        self.assertFalse(has_permission(user, 'DELETE_ROLE'))
+
+class RoleListQueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@acme.com')
+        self.permissions = [Permission.objects.create(name=f'PERM_{i}') for i in range(5)]
+        role = Role.objects.create(name='Role Admin')
+        role.permissions.add(Permission.objects.create(name='VIEW_ROLES'))
+        UserRole.objects.create(user=self.admin, role=role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_roles(self, count):
+        start = Role.objects.count()
+        for i in range(start, start + count):
+            Role.objects.create(name=f'Role {i}').permissions.set(self.permissions[:i % 5 + 1])
+
+    def test_query_count_does_not_grow_with_roles(self):
+        self.add_roles(2)
+        # roles and the permissions prefetch
+        self.assertListingQueriesConstant('/api/roles/', lambda: self.add_roles(15), 2)
+
+class RolePermissionPatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Committed, so its notifications are not folded into the ones under test
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ['VIEW_USERS', 'CREATE_USER', 'DELETE_USER']:
+                Permission.objects.create(name=name)
+            admin_role = Role.objects.create(name='Permission Admin')
+            admin_role.permissions.add(Permission.objects.create(name='ASSIGN_PERMISSIONS'))
+            self.admin = User.objects.create_user(username='admin', email='admin@acme.com')
+            UserRole.objects.create(user=self.admin, role=admin_role)
+            self.role = Role.objects.create(name='Staff')
+            self.role.permissions.add(Permission.objects.get(name='VIEW_USERS'))
+            self.holder = User.objects.create_user(username='holder', email='holder@acme.com')
+            UserRole.objects.create(user=self.holder, role=self.role)
+        get_effective_permissions(self.admin)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/api/roles/{self.role.pk}/permissions/', data, format='json')
+        return response, [query['sql'] for query in queries]
+
+    def test_patch_writes_and_reports_only_the_changes(self):
+        self.assertEqual(get_effective_permissions(self.holder), {'VIEW_USERS'})
+        with mock.patch('accounts.notifications.notification_sender.send') as send, \
+                self.captureOnCommitCallbacks(execute=True):
+            response, queries = self.patch({'add': ['CREATE_USER', 'VIEW_USERS'], 'remove': ['DELETE_USER']})
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'added': ['CREATE_USER'], 'removed': [], 'permissions': ['CREATE_USER', 'VIEW_USERS']})
+        through = Role.permissions.through._meta.db_table
+        self.assertEqual(len([sql for sql in queries if sql.startswith(f'INSERT INTO "{through}"')]), 1)
+        self.assertFalse([sql for sql in queries if sql.startswith(f'DELETE FROM "{through}"')])
+
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.permission_mask, names_to_mask(['CREATE_USER', 'VIEW_USERS']))
+        self.assertEqual(get_effective_permissions(self.holder), {'CREATE_USER', 'VIEW_USERS'})
+        send.assert_called_once_with(([], [self.role.pk]))
+
+        response, queries = self.patch({'remove': ['VIEW_USERS', 'CREATE_USER']})
+        self.assertEqual(response.data['removed'], ['CREATE_USER', 'VIEW_USERS'])
+        self.assertEqual(len([sql for sql in queries if sql.startswith(f'DELETE FROM "{through}"')]), 1)
+        self.assertEqual(list(self.role.permissions.all()), [])
+
+    def test_holder_versions_are_bumped_only_after_commit(self):
+        self.assertEqual(get_effective_permissions(self.holder), {'VIEW_USERS'})
+        version = get_permission_version(self.holder.pk)
+        with mock.patch('accounts.notifications.notification_sender.send'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response, _ = self.patch({'add': ['CREATE_USER']})
+                self.assertEqual(response.status_code, 200, response.data)
+                # A reader racing the commit still sees the old rows; it can only
+                # cache them under the version the commit is about to retire
+                self.assertEqual(get_permission_version(self.holder.pk), version)
+                self.assertEqual(get_effective_permissions(self.holder), {'VIEW_USERS'})
+            for callback in callbacks:
+                callback()
+
+        self.assertNotEqual(get_permission_version(self.holder.pk), version)
+        self.assertEqual(get_effective_permissions(self.holder), {'CREATE_USER', 'VIEW_USERS'})
+
+    def test_no_op_patch_invalidates_nothing(self):
+        version = get_permission_version(self.holder.pk)
+        response, queries = self.patch({'add': ['VIEW_USERS'], 'remove': ['DELETE_USER']})
+        self.assertEqual((response.data['added'], response.data['removed']), ([], []))
+        self.assertEqual(get_permission_version(self.holder.pk), version)
+        self.assertFalse([sql for sql in queries if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))])
+
+    def test_names_are_validated_against_the_cached_catalog(self):
+        response, queries = self.patch({'add': ['VIEW_USERS', 'NOT_A_PERMISSION']})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('NOT_A_PERMISSION', str(response.data))
+        self.assertFalse([sql for sql in queries if 'roles_permission' in sql])
+
+        response, _ = self.patch({'add': ['VIEW_USERS'], 'remove': ['VIEW_USERS']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_assign_permissions(self):
+        self.client.force_authenticate(self.holder)
+        response, _ = self.patch({'add': ['CREATE_USER']})
+        self.assertEqual(response.status_code, 403)
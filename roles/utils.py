@@ -0,0 +1,180 @@
+import functools
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Permission, UserRole
+
+PERMISSION_VERSION_KEY = 'perm_version:{user_id}'
+CATALOG_VERSION_KEY = 'perm_catalog_version'
+CATALOG_KEY = 'perm_catalog:v2:{catalog_version}'
+USER_MASK_KEY = 'perm_mask:{user_id}:{catalog_version}:{version}'
+
+PermissionCatalog = namedtuple('PermissionCatalog', ['bits', 'names', 'all_mask', 'ids'])
+
+# Process-local copy of the catalog so permission checks don't unpickle it
+_catalog_memo = {}
+
+def _new_version():
+    # Wall-clock based so a version recreated after cache eviction never
+    # collides with one that was handed out before it
+    return time.time_ns()
+
+def _get_or_create_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+def get_permission_version(user_id):
+    """Current permission version for a user (changes whenever their roles do)"""
+    key = PERMISSION_VERSION_KEY.format(user_id=user_id)
+    return _get_or_create_versions([key])[key]
+
+def get_permission_versions(user_id):
+    """(catalog version, user permission version) read with a single cache call"""
+    key = PERMISSION_VERSION_KEY.format(user_id=user_id)
+    versions = _get_or_create_versions([CATALOG_VERSION_KEY, key])
+    return versions[CATALOG_VERSION_KEY], versions[key]
+
+# Version bumps wait for the transaction that changed roles to commit: bumped
+# any earlier, a concurrent reader could cache (or put in a token) the old
+# roles under the new version, and nothing would invalidate them again.
+_pending = threading.local()
+
+def bump_permission_versions(user_ids):
+    """Invalidate the cached effective permissions of the given users once the current transaction commits"""
+    _defer_bumps(user_ids=user_ids)
+
+def bump_role_holder_versions(role_ids):
+    """Like bump_permission_versions, for every holder of the given roles (looked up after the commit)"""
+    _defer_bumps(role_ids=role_ids)
+
+def _defer_bumps(user_ids=(), role_ids=()):
+    # One callback per transaction, reset if the transaction that scheduled
+    # it rolled back (see accounts.notifications._collect)
+    connection = transaction.get_connection()
+    callback = getattr(_pending, 'callback', None)
+    scheduled = (
+        callback is not None and connection.in_atomic_block
+        and any(func is callback for _, func, _ in connection.run_on_commit)
+    )
+    if not scheduled:
+        _pending.users, _pending.roles = set(), set()
+        _pending.callback = callback = functools.partial(_apply_bumps)
+    _pending.users.update(user_ids)
+    _pending.roles.update(role_ids)
+    if not scheduled:
+        transaction.on_commit(callback)
+
+def _apply_bumps():
+    users, roles = _pending.users, _pending.roles
+    _pending.users, _pending.roles, _pending.callback = set(), set(), None
+    if roles:
+        users |= set(UserRole.objects.filter(role_id__in=roles).values_list('user_id', flat=True))
+    for user_id in users:
+        _bump(PERMISSION_VERSION_KEY.format(user_id=user_id))
+
+def bump_catalog_version():
+    """Invalidate every cached permission set (permission catalog changed)"""
+    _bump(CATALOG_VERSION_KEY)
+
+def _load_catalog(catalog_version):
+    if _catalog_memo.get('version') == catalog_version:
+        return _catalog_memo['catalog']
+
+    key = CATALOG_KEY.format(catalog_version=catalog_version)
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(Permission.objects.exclude(bit=None).values_list('name', 'bit', 'pk'))
+        cache.set(key, rows, None)
+
+    catalog = PermissionCatalog(
+        bits={name: bit for name, bit, _ in rows},
+        names={bit: name for name, bit, _ in rows},
+        all_mask=sum(1 << bit for _, bit, _ in rows),
+        ids={name: pk for name, _, pk in rows},
+    )
+    _catalog_memo.update(version=catalog_version, catalog=catalog)
+    return catalog
+
+def get_permission_catalog():
+    """Compiled catalog of permission name <-> bit index (and name -> primary key)"""
+    catalog_version = _get_or_create_versions([CATALOG_VERSION_KEY])[CATALOG_VERSION_KEY]
+    return _load_catalog(catalog_version)
+
+def names_to_mask(names):
+    """Compile permission names into a bitmask (unknown names are ignored)"""
+    bits = get_permission_catalog().bits
+    mask = 0
+    for name in names:
+        if name in bits:
+            mask |= 1 << bits[name]
+    return mask
+
+def mask_to_names(mask):
+    """Expand a bitmask into the sorted permission name list the frontend expects"""
+    names = get_permission_catalog().names
+    return sorted(name for bit, name in names.items() if mask >> bit & 1)
+
+def _resolve(user):
+    if not user or not user.is_authenticated:
+        return get_permission_catalog(), 0
+
+    if user.is_superuser:
+        catalog = get_permission_catalog()
+        return catalog, catalog.all_mask
+
+    # Users authenticated from permission-carrying tokens already know their mask
+    token_mask = getattr(user, 'token_permission_mask', None)
+    if token_mask is not None:
+        return _load_catalog(user.token_catalog_version), token_mask
+
+    version_key = PERMISSION_VERSION_KEY.format(user_id=user.pk)
+    versions = _get_or_create_versions([CATALOG_VERSION_KEY, version_key])
+    catalog = _load_catalog(versions[CATALOG_VERSION_KEY])
+    key = USER_MASK_KEY.format(
+        user_id=user.pk,
+        catalog_version=versions[CATALOG_VERSION_KEY],
+        version=versions[version_key],
+    )
+    mask = cache.get(key)
+    if mask is None:
+        mask = 0
+        for role_mask in UserRole.objects.filter(user_id=user.pk).values_list('role__permission_mask', flat=True):
+            mask |= role_mask
+        cache.set(key, mask, settings.PERMISSION_CACHE_TIMEOUT)
+    return catalog, mask
+
+def resolve_permissions(user):
+    """(catalog, effective mask) for the user, for callers that test several names"""
+    return _resolve(user)
+
+def get_effective_mask(user):
+    """
+    Return the OR of the permission masks of all the user's roles.
+    Superusers get every permission. Masks are cached per user and keyed by
+    the user's permission version, so role changes take effect immediately.
+    """
+    return _resolve(user)[1]
+
+def has_permission(user, name):
+    """Single bitwise test against the user's cached effective mask"""
+    catalog, mask = _resolve(user)
+    bit = catalog.bits.get(name)
+    return bit is not None and bool(mask >> bit & 1)
+
+def get_effective_permissions(user):
+    """Names of all permissions granted to the user"""
+    catalog, mask = _resolve(user)
+    return frozenset(name for bit, name in catalog.names.items() if mask >> bit & 1)
@@ -1,8 +1,11 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 from .models import Role, Permission, UserRole
-from .serializers import RoleSerializer, RoleCreateUpdateSerializer, PermissionSerializer, AssignPermissionsSerializer
+from .serializers import RoleSerializer, RoleCreateUpdateSerializer, PermissionSerializer, AssignPermissionsSerializer, PatchPermissionsSerializer
+from .signals import roles_changed
+from .utils import get_permission_catalog, mask_to_names
 from companies.permissions import HasPermission
 from companies.mixins import CompanyIsolationMixin
 from audit.utils import log_action
@@ -12,7 +15,9 @@ class RoleViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     
     def get_queryset(self):
         # All users can see all roles (system-wide roles)
-        return Role.objects.all()
+        if self.action == 'patch_permissions':
+            return Role.objects.all()
+        return Role.objects.prefetch_related('permissions')
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -51,14 +56,52 @@ class RoleViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
         serializer = AssignPermissionsSerializer(data=request.data)
         
         if serializer.is_valid():
-            permission_names = serializer.validated_data['permissions']
-            permissions_objs = Permission.objects.filter(name__in=permission_names)
-            role.permissions.set(permissions_objs)
+            permission_ids = get_permission_catalog().ids
+            role.permissions.set([permission_ids[name] for name in serializer.validated_data['permissions'] if name in permission_ids])
             
             log_action(request.user, 'UPDATE', 'Role', str(role.id), f'Updated permissions for role: {role.name}', request)
             
             return Response({'message': 'Permissions assigned successfully'})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['patch'], url_path='permissions', permission_classes=[permissions.IsAuthenticated])
+    def patch_permissions(self, request, pk=None):
+        """Add and/or remove permissions, writing only the through rows that change"""
+        # get_permissions() replaces action-level permission classes, so check here
+        if not self.request_context.has_permission('ASSIGN_PERMISSIONS'):
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        role = self.get_object()
+        serializer = PatchPermissionsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        catalog = get_permission_catalog()
+        through = Role.permissions.through
+        with transaction.atomic():
+            # Locked so concurrent patches of the same role apply one after another
+            mask = Role.objects.select_for_update().values_list('permission_mask', flat=True).get(pk=role.pk)
+            added = [name for name in serializer.validated_data['add'] if not mask >> catalog.bits[name] & 1]
+            removed = [name for name in serializer.validated_data['remove'] if mask >> catalog.bits[name] & 1]
+            
+            # Bulk writes send no m2m_changed, so the mask and holders are updated here
+            if added:
+                through.objects.bulk_create([through(role_id=role.pk, permission_id=catalog.ids[name]) for name in added])
+                for name in added:
+                    mask |= 1 << catalog.bits[name]
+            if removed:
+                through.objects.filter(role_id=role.pk, permission_id__in=[catalog.ids[name] for name in removed]).delete()
+                for name in removed:
+                    mask &= ~(1 << catalog.bits[name])
+            if added or removed:
+                Role.objects.filter(pk=role.pk).update(permission_mask=mask)
+                roles_changed([role.pk])
+        
+        if added or removed:
+            changes = ', '.join([f'+{name}' for name in added] + [f'-{name}' for name in removed])
+            log_action(request.user, 'UPDATE', 'Role', str(role.id), f'Updated permissions for role: {role.name} ({changes})', request)
+        
+        return Response({'added': added, 'removed': removed, 'permissions': mask_to_names(mask)})
 
 class PermissionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Permission.objects.all()